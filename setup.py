@@ -16,7 +16,8 @@ setup(
     install_requires=[
         "docker",
         "aiohttp",
-        "pillow"
+        "pillow",
+        "numpy"
     ],
     python_requires=">=3.7",
 )
@@ -0,0 +1,87 @@
+from collections import deque
+import asyncio
+import functools
+import logging
+import time
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+class QueuedAction:
+    """An action waiting for its turn, and the callers waiting for its result"""
+    def __init__(self, name, call, future):
+        self.name = name
+        self.call = call
+        self.futures = [future]
+        self.queued_at = time.perf_counter()
+
+class ActionQueue:
+    """Runs the actions sent to one container one at a time, in the order they arrive.
+
+    Without it, concurrent commands could interleave the requests of
+    multi-step actions, e.g. one click's mouse-move landing between another
+    click's mouse-move and left-click. Mouse moves still waiting behind
+    another action are merged, so only the last position is sent.
+    """
+    def __init__(self, api_url):
+        self.api_url = api_url
+        self.pending = deque()
+        self._worker = None
+
+    @property
+    def depth(self):
+        """Number of actions waiting to run"""
+        return len(self.pending)
+
+    async def run(self, name, call, merge=False):
+        """Queue an action and wait for its result.
+
+        Args:
+            name: Name of the action, used for merging and metrics
+            call: Coroutine function running the action, called without arguments
+            merge: Replace a queued action of the same name that has not started yet
+        """
+        future = asyncio.get_running_loop().create_future()
+        if merge and self.pending and self.pending[-1].name == name:
+            # The queued action would be overridden straight away, so only send this one
+            queued = self.pending.pop()
+            queued.call = call
+            queued.futures.append(future)
+            metrics.ACTIONS_MERGED.inc(action=name, container=self.api_url)
+        else:
+            queued = QueuedAction(name, call, future)
+        self.pending.append(queued)
+        metrics.ACTION_QUEUE_DEPTH.set(self.depth, container=self.api_url)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._work())
+        # A caller giving up does not stop the action, which may already be running
+        return await asyncio.shield(future)
+
+    async def _work(self):
+        """Run queued actions until the queue is empty"""
+        while self.pending:
+            queued = self.pending.popleft()
+            metrics.ACTION_QUEUE_DEPTH.set(self.depth, container=self.api_url)
+            metrics.ACTION_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued.queued_at,
+                                                      action=queued.name, container=self.api_url)
+            try:
+                result = await queued.call()
+            except Exception as e:
+                logger.error(f"Queued {queued.name} error: {str(e)}")
+                result = {"status": "error", "message": str(e)}
+            for index, future in enumerate(queued.futures):
+                if not future.done():
+                    # Callers of merged actions each get their own copy to add to
+                    future.set_result(dict(result) if index and isinstance(result, dict) else result)
+
+def queued_action(merge=False):
+    """Run a ComputerClient action through the client's action queue.
+    The undecorated method stays available as __wrapped__ for callers that
+    already hold the queue, such as batch.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            return await self.actions.run(method.__name__, functools.partial(method, self, *args, **kwargs), merge)
+        return wrapper
+    return decorate
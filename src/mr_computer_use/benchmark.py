@@ -0,0 +1,170 @@
+"""Latency benchmark for the computer use commands, run against the fake server.
+
+Measures the plugin's own overhead (HTTP client, screenshot handling,
+command logic) without a desktop container:
+
+    python -m mr_computer_use.benchmark --iterations 100 --latency-ms 5 --width 1920 --height 1080
+"""
+from io import BytesIO
+import argparse
+import base64
+import asyncio
+import json
+import math
+import time
+from . import mod
+from .computer_client import get_client_for_url, set_session_api_url, clear_session_api_url, close_computer_clients
+from .fake_server import FakeComputerServer
+
+# Commands exercised by the benchmark, with the parameters they are called with
+SCENARIOS = [
+    ("computer_screenshot", {}),
+    ("computer_click", {"x": 100, "y": 200}),
+    ("computer_mouse_move", {"x": 300, "y": 400}),
+    ("computer_type", {"text": "Hello, world!"}),
+    ("computer_press_key", {"key": "enter"}),
+    ("computer_scroll", {"amount": 300}),
+    ("computer_drag", {"start_x": 100, "start_y": 200, "end_x": 300, "end_y": 400}),
+    ("computer_get_cursor_position", {}),
+    ("computer_get_screen_size", {}),
+    ("computer_batch", {"actions": [
+        {"action": "click", "x": 400, "y": 300},
+        {"action": "type", "text": "jane@example.com"},
+        {"action": "key", "key": "tab"},
+        {"action": "key", "key": "enter"}
+    ]}),
+]
+
+class BenchmarkChatLog:
+    """Stand-in chat log that counts the images added to it"""
+    def __init__(self, context):
+        self.context = context
+
+    def add_message(self, message):
+        self.context.count_images(message.get("content"))
+
+class BenchmarkContext:
+    """Minimal stand-in for the chat context the commands are called with.
+    The size of the images added to the chat or returned by a command is counted.
+    """
+    def __init__(self, log_id="benchmark", agent_name=None):
+        self.log_id = log_id
+        self.agent_name = agent_name
+        self.image_bytes = 0
+        self.chat_log = BenchmarkChatLog(self)
+
+    def count_images(self, parts):
+        """Add the size of the images in a list of message content parts"""
+        for part in parts if isinstance(parts, list) else []:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                self.image_bytes += len(base64.b64decode(part["image_url"]["url"].split(",", 1)[1]))
+
+    async def format_image_message(self, img):
+        buffer = BytesIO()
+        img.save(buffer, format=img.format or "PNG")
+        self.image_bytes += len(buffer.getvalue())
+        return {"type": "image", "bytes": len(buffer.getvalue())}
+
+def percentile(values, pct):
+    """Get the nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+async def run_scenario(name, params, iterations, warmup, context):
+    """Run one command repeatedly and collect its latency, payload size and errors"""
+    command = getattr(mod, name)
+    for _ in range(warmup):
+        await command(**params, context=context)
+
+    latencies = []
+    errors = 0
+    context.image_bytes = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        result = await command(**params, context=context)
+        latencies.append((time.perf_counter() - call_started) * 1000)
+        context.count_images([result])
+        if isinstance(result, dict) and result.get("status") == "error":
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    return {
+        "command": name,
+        "iterations": iterations,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "throughput_per_s": round(iterations / elapsed, 1),
+        "bytes_per_command": round(context.image_bytes / iterations),
+        "errors": errors
+    }
+
+async def run_benchmark(iterations=50, warmup=5, commands=None, port=3199, **server_options):
+    """Start the fake server, benchmark each command against it and return the results"""
+    server = FakeComputerServer(**server_options)
+    api_url = await server.start(port=port)
+    context = BenchmarkContext()
+    # Point the benchmark session at the fake server, as the container pool does
+    set_session_api_url(context.log_id, api_url)
+    try:
+        await get_client_for_url(api_url).wait_until_ready(timeout=5)
+        results = []
+        for name, params in SCENARIOS:
+            if commands and name not in commands:
+                continue
+            results.append(await run_scenario(name, params, iterations, warmup, context))
+        return results
+    finally:
+        clear_session_api_url(context.log_id)
+        await close_computer_clients()
+        await server.stop()
+
+def format_results(results):
+    """Format benchmark results as a text table"""
+    columns = ["command", "iterations", "p50_ms", "p99_ms", "throughput_per_s", "bytes_per_command", "errors"]
+    widths = [max(len(column), *(len(str(row[column])) for row in results)) for column in columns]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    for row in results:
+        lines.append("  ".join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the computer use commands against the fake server")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--commands", nargs="*", help="Only run these commands")
+    parser.add_argument("--port", type=int, default=3199)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-format", choices=["png", "jpeg"], default="png")
+    parser.add_argument("--json-screenshots", action="store_true", help="Make the fake server send base64 JSON screenshots")
+    parser.add_argument("--no-clipboard", action="store_true", help="Leave out the fake server's clipboard endpoint")
+    parser.add_argument("--type-ms-per-char", type=float, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(
+        iterations=args.iterations,
+        warmup=args.warmup,
+        commands=args.commands,
+        port=args.port,
+        width=args.width,
+        height=args.height,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        image_format=args.image_format,
+        binary=not args.json_screenshots,
+        clipboard=not args.no_clipboard,
+        type_ms_per_char=args.type_ms_per_char
+    ))
+    print(json.dumps(results, indent=2) if args.json else format_results(results))
+
+if __name__ == "__main__":
+    main()
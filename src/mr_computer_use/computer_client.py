@@ -1,62 +1,275 @@
 from lib.providers.services import service
 import aiohttp
+import asyncio
+import json
+import time
+from collections import OrderedDict
 import base64
-from io import BytesIO
-from PIL import Image
 import logging
+from .docker_control import _get_config, DEFAULT_HTTP_CONFIG, DEFAULT_TYPING_CONFIG
+from . import metrics
+from .action_queue import ActionQueue, queued_action
+from .keys import map_key_to_xdotool, parse_keys, KeySpecError
+from .image_processing import NATIVE_TRANSFORM, encode_screenshot, frame_thumbnail, frame_difference, frame_array, changed_fraction
 
 logger = logging.getLogger(__name__)
 
-def map_key_to_xdotool(key):
-    """
-    Maps common key names to their xdotool equivalents.
-    This ensures consistent handling of special keys across the codebase.
+# Shared clients, one per Computer Use API endpoint
+_clients = {}
+
+# API URL of the pool container assigned to each chat session
+_session_api_urls = {}
+
+# When each session last used its client (time.monotonic), for idle reaping
+_session_last_used = {}
+
+# Max number of sessions whose last delivered frame is remembered per client
+MAX_TRACKED_SESSIONS = 100
+
+# Sessions whose pool container was released for being idle, oldest first
+_released_sessions = OrderedDict()
+
+# Accept header for screenshots: raw image bodies preferred, JSON with base64 as fallback
+SCREENSHOT_ACCEPT = "image/png, image/jpeg, image/webp, application/json;q=0.5"
+
+# Statuses meaning the desktop API has no clipboard endpoint
+CLIPBOARD_UNSUPPORTED_STATUSES = (404, 405, 501)
+
+# Seconds a failed screen size lookup is remembered before asking the API again
+SCREEN_SIZE_ERROR_TTL = 5.0
+
+# Action names accepted by ComputerClient.batch, mapped to client methods
+BATCH_ACTIONS = {
+    "click": "click",
+    "type": "type_text",
+    "key": "press_key",
+    "scroll": "scroll",
+    "mouse_move": "mouse_move",
+    "right_click": "right_click",
+    "double_click": "double_click",
+    "drag": "drag",
+}
+# Batch actions whose coordinates are mapped from screenshot space
+POINTER_ACTIONS = {"click", "mouse_move", "drag"}
+
+def _extract_image_data(body):
+    """Get the image bytes from a JSON screenshot response.
     
-    Args:
-        key: The key name to map
-        
-    Returns:
-        The xdotool key name
+    The base64 payload is decoded straight out of the response body, without
+    building the parsed JSON document and its string copies first. Responses
+    that don't have the expected layout go through the JSON parser.
     """
-    # Dictionary mapping common key names to xdotool key names
-    key_map = {
-        # Common name conversions
-        "enter": "Return",
-        "return": "Return",
-        "esc": "Escape",
-        "escape": "Escape",
-        "tab": "Tab",
-        "space": "space",
-        "backspace": "BackSpace",
-        "delete": "Delete",
-        # Arrow keys
-        "up": "Up", "down": "Down", "left": "Left", "right": "Right",
-        # Other special keys
-        "home": "Home", "end": "End", "pageup": "Page_Up", "pagedown": "Page_Down",
-        "insert": "Insert", "printscreen": "Print",
-    }
-    
-    # Return the mapped key or the original if not in the map (case-insensitive check)
-    return key_map.get(key.lower(), key)
+    start = body.find(b'base64,')
+    if start != -1:
+        start += len(b'base64,')
+        end = body.find(b'"', start)
+        # Escaped characters mean the payload isn't plain base64
+        if end != -1 and body.find(b'\\', start, end) == -1:
+            return base64.b64decode(memoryview(body)[start:end])
+    data = json.loads(body)
+    return base64.b64decode(data['image'].split(',')[1] if ',' in data['image'] else data['image'])
 
 class ComputerClient:
-    def __init__(self, api_url="http://localhost:3100"):
+    def __init__(self, api_url="http://localhost:3100", http_config=None):
         self.api_url = api_url
+        self.http_config = http_config or {}
+        self._session = None
+        # Actions run one at a time, in order
+        self.actions = ActionQueue(api_url)
+        # Paste long text until the server turns out to have no clipboard endpoint
+        self._clipboard_supported = True
+        # Ask for raw image bodies until the server turns the request down
+        self._binary_screenshots = True
+        # Signature of the last frame delivered to each session, oldest first
+        self._last_frames = OrderedDict()
+        # Bumped when each action is sent and again when it completes, so frames
+        # captured before or during one are not shared after it
+        self._action_generation = 0
+        # Last downloaded frame as (generation, time.monotonic(), bytes), and the download in flight
+        self._recent_frame = None
+        self._frame_download = None
+        # Mirrored cursor position as (x, y, time.monotonic()) in native screen coordinates
+        self._cursor = None
+        # Cached screen size result, and when a cached failure expires
+        self._screen_size = None
+        self._screen_size_expires = 0.0
+
+    def _get_session(self):
+        """Get the long-lived HTTP session, creating it on first use.
+        
+        The session keeps a pool of keep-alive connections to the API so
+        consecutive actions don't pay for a new TCP connection each time.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.http_config.get("pool_limit", 10),
+                limit_per_host=self.http_config.get("pool_limit", 10),
+                keepalive_timeout=self.http_config.get("keepalive_timeout", 30)
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=self.http_config.get("total_timeout", 60),
+                connect=self.http_config.get("connect_timeout", 5)
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                  trace_configs=[self._metrics_trace_config()])
+        return self._session
+
+    def _metrics_trace_config(self):
+        """Build hooks that record the latency and errors of every API request"""
+        def note_action(params):
+            if params.method == "POST":
+                # Every action is a POST. Frames captured before it or while it ran must not be reused.
+                self._action_generation += 1
+                self._recent_frame = None
+
+        async def on_request_start(session, trace_config_ctx, params):
+            trace_config_ctx.started = time.perf_counter()
+            note_action(params)
+
+        async def on_request_end(session, trace_config_ctx, params):
+            note_action(params)
+            endpoint = params.url.path.rsplit('/', 1)[-1]
+            elapsed = time.perf_counter() - trace_config_ctx.started
+            metrics.HTTP_SECONDS.observe(elapsed, endpoint=endpoint, container=self.api_url)
+            metrics.log_if_slow("request", endpoint, self.api_url, elapsed)
+            if params.response.status >= 400:
+                metrics.HTTP_ERRORS.inc(endpoint=endpoint, container=self.api_url)
+
+        async def on_request_exception(session, trace_config_ctx, params):
+            note_action(params)
+            endpoint = params.url.path.rsplit('/', 1)[-1]
+            metrics.HTTP_ERRORS.inc(endpoint=endpoint, container=self.api_url)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    def is_frame_unchanged(self, session_id, screenshot, threshold=0.0):
+        """Check a frame against the last one delivered to a session.
+        
+        Identical frames are recognised by the hash of their encoded bytes,
+        so only near-identical ones with a threshold set need decoding. The
+        frame becomes the session's last delivered frame unless it is
+        unchanged, so a slow drift is still caught once it adds up.
+        
+        Args:
+            session_id: Chat session the frame would be delivered to
+            screenshot: The Screenshot about to be delivered
+            threshold: Fraction of changed pixels still treated as unchanged
+        """
+        last = self._last_frames.get(session_id)
+        thumbnail = None
+        if last is not None:
+            last_digest, last_thumbnail = last
+            if screenshot.digest == last_digest:
+                return True
+            if threshold > 0 and last_thumbnail is not None:
+                thumbnail = frame_thumbnail(screenshot)
+                if frame_difference(thumbnail, last_thumbnail) <= threshold:
+                    return True
+        self.remember_frame(session_id, screenshot, threshold, thumbnail)
+        return False
+
+    def remember_frame(self, session_id, screenshot, threshold=0.0, thumbnail=None):
+        """Record a frame as the last one delivered to a session.
+        A thumbnail for approximate comparisons is only kept when a threshold is set.
+        """
+        if threshold > 0 and thumbnail is None:
+            thumbnail = frame_thumbnail(screenshot)
+        self._last_frames[session_id] = (screenshot.digest, thumbnail)
+        self._last_frames.move_to_end(session_id)
+        while len(self._last_frames) > MAX_TRACKED_SESSIONS:
+            self._last_frames.popitem(last=False)
+
+    async def close(self):
+        """Close the HTTP session and its pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get_screenshot(self, settings=None, max_age=None):
+        """Capture a screenshot from the VM
+        
+        Args:
+            settings: Optional screenshot encoding settings (max dimensions,
+                      format, quality, grayscale)
+            max_age: Seconds a frame taken since the last action may be
+                     reused for (default: the screenshot_reuse_ms setting)
         
-    async def get_screenshot(self):
-        """Capture a screenshot from the VM"""
+        Returns:
+            Screenshot holding the encoded image, or None on failure
+        """
+        img_data = await self._get_frame_data(max_age)
+        if img_data is None:
+            return None
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/screenshot"
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        img_data = base64.b64decode(data['image'].split(',')[1] if ',' in data['image'] else data['image'])
-                        img = Image.open(BytesIO(img_data))
-                        return img
-                    else:
-                        logger.error(f"Failed to get screenshot: {response.status}")
-                        return None
+            encode_started = time.perf_counter()
+            screenshot, info = encode_screenshot(img_data, settings)
+            metrics.SCREENSHOT_ENCODE_SECONDS.observe(time.perf_counter() - encode_started,
+                                                      container=self.api_url)
+            metrics.SCREENSHOT_BYTES.observe(info["bytes"], container=self.api_url)
+            self._note_screen_size(info["original_width"], info["original_height"])
+            return screenshot
+        except Exception as e:
+            logger.error(f"Screenshot error: {str(e)}")
+            return None
+
+    async def _get_frame_data(self, max_age=None):
+        """Get the bytes of the current frame, sharing captures between callers.
+        
+        Concurrent callers wait for the same download instead of each
+        starting their own, and a frame finished within max_age seconds is
+        reused. Neither applies across an action, so a frame is never older
+        than the last action, nor taken while it was still running.
+        """
+        if max_age is None:
+            max_age = self.http_config.get("screenshot_reuse_ms", 0) / 1000
+        generation = self._action_generation
+        recent = self._recent_frame
+        if recent is not None and recent[0] == generation and time.monotonic() - recent[1] <= max_age:
+            metrics.SCREENSHOT_SHARED.inc(container=self.api_url, source="recent")
+            return recent[2]
+        
+        inflight = self._frame_download
+        if inflight is not None and inflight[0] == generation and not inflight[1].done():
+            metrics.SCREENSHOT_SHARED.inc(container=self.api_url, source="inflight")
+        else:
+            inflight = self._frame_download = (generation, asyncio.ensure_future(self._download_frame(generation)))
+        # A caller giving up must not cancel the download for everyone else
+        return await asyncio.shield(inflight[1])
+
+    async def _download_frame(self, generation):
+        """Download the current frame and remember it for reuse"""
+        try:
+            session = self._get_session()
+            url = f"{self.api_url}/computer-use/screenshot"
+            headers = {"Accept": SCREENSHOT_ACCEPT} if self._binary_screenshots else None
+            started = time.perf_counter()
+            async with session.get(url, headers=headers) as response:
+                if response.status == 406 and headers:
+                    # The server can't send raw images, so stick to JSON from now on
+                    self._binary_screenshots = False
+                    return await self._download_frame(generation)
+                if response.status != 200:
+                    logger.error(f"Failed to get screenshot: {response.status}")
+                    return None
+                body = await response.read()
+                decode_started = time.perf_counter()
+                metrics.SCREENSHOT_CAPTURE_SECONDS.observe(decode_started - started, container=self.api_url)
+                
+                if response.content_type.startswith("image/"):
+                    # Raw image body, no unpacking needed
+                    img_data = body
+                else:
+                    img_data = _extract_image_data(body)
+                metrics.SCREENSHOT_DECODE_SECONDS.observe(time.perf_counter() - decode_started,
+                                                          container=self.api_url)
+                if generation == self._action_generation:
+                    # Only a frame no action overlapped is worth keeping
+                    self._recent_frame = (generation, time.monotonic(), img_data)
+                return img_data
         except Exception as e:
             logger.error(f"Screenshot error: {str(e)}")
             return None
@@ -82,50 +295,141 @@ class ComputerClient:
             except:
                 return {"status": "error", "message": f"Request failed with status: {response.status}"}
 
-    async def click(self, x, y):
-        """Click at the specified coordinates"""
+    @queued_action()
+    async def click(self, x, y, transform=NATIVE_TRANSFORM):
+        """Click at the specified coordinates
+        
+        Args:
+            x, y: Coordinates in the screenshot space of the transform
+            transform: ScreenTransform mapping them to the native screen
+        """
         try:
-            async with aiohttp.ClientSession() as session:
-                # First move to the coordinates
-                url = f"{self.api_url}/computer-use/mouse-move"
-                payload = {"x": x, "y": y}
-                async with session.post(url, json=payload) as response:
-                    await self._handle_response(response)
-                
-                # Then click
-                url = f"{self.api_url}/computer-use/left-click"
-                async with session.post(url) as response:
-                    return await self._handle_response(response)
+            session = self._get_session()
+            x, y = transform.to_screen(x, y)
+            url = f"{self.api_url}/computer-use/left-click"
+            if self.http_config.get("fused_click"):
+                # The server moves the pointer itself, saving a round trip
+                async with session.post(url, json={"x": x, "y": y}) as response:
+                    return self._note_cursor(await self._handle_response(response), x, y)
+            
+            # First move to the coordinates
+            move_url = f"{self.api_url}/computer-use/mouse-move"
+            payload = {"x": x, "y": y}
+            async with session.post(move_url, json=payload) as response:
+                await self._handle_response(response)
+            
+            # Then click
+            async with session.post(url) as response:
+                return self._note_cursor(await self._handle_response(response), x, y)
         except Exception as e:
             logger.error(f"Click error: {str(e)}")
             return {"status": "error", "message": str(e)}
     
-    async def type_text(self, text):
-        """Type text"""
-        try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/type"
-                payload = {"text": text}
-                async with session.post(url, json=payload) as response:
-                    return await self._handle_response(response)
+    @queued_action()
+    async def type_text(self, text, method="auto"):
+        """Type text, pasting long text through the clipboard
+        
+        Args:
+            text: The text to enter
+            method: "auto" pastes text of at least typing.paste_min_length
+                    characters and types shorter text; "paste" or "type"
+                    force one way
+        
+        Returns:
+            Dict with the status, the method used, elapsed_ms and, when
+            typing, how many characters were typed before any error
+        """
+        if method not in ("auto", "paste", "type"):
+            return {"status": "error", "message": f"Unknown typing method: {method}"}
+        typing = {**DEFAULT_TYPING_CONFIG, **_get_config().get("typing", {})}
+        started = time.perf_counter()
+        result = None
+        if method == "paste" or (method == "auto" and self._clipboard_supported
+                                 and len(text) >= typing["paste_min_length"]):
+            result = await self._paste_text(text, typing["paste_key"])
+            if result is None and method == "paste":
+                result = {"status": "error", "message": "The desktop API has no clipboard endpoint"}
+        if result is None:
+            result = await self._type_chunks(text, max(1, int(typing["chunk_size"])))
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+        return result
+
+    async def _paste_text(self, text, paste_key):
+        """Put text on the desktop's clipboard and paste it.
+        Returns None if the server has no clipboard endpoint.
+        """
+        try:
+            session = self._get_session()
+            url = f"{self.api_url}/computer-use/clipboard"
+            async with session.post(url, json={"text": text}) as response:
+                if response.status in CLIPBOARD_UNSUPPORTED_STATUSES:
+                    # Don't try again, type long text instead from now on
+                    self._clipboard_supported = False
+                    return None
+                result = await self._handle_response(response)
+            if result.get("status") == "error":
+                return {**result, "method": "paste"}
+            url = f"{self.api_url}/computer-use/key"
+            async with session.post(url, json={"key": " ".join(parse_keys(paste_key))}) as response:
+                result = await self._handle_response(response)
+            return {**result, "method": "paste"}
+        except Exception as e:
+            logger.error(f"Paste text error: {str(e)}")
+            return {"status": "error", "message": str(e), "method": "paste"}
+
+    async def _type_chunks(self, text, chunk_size):
+        """Type text in chunks of chunk_size characters, stopping at the first error"""
+        url = f"{self.api_url}/computer-use/type"
+        typed = 0
+        try:
+            session = self._get_session()
+            while typed < len(text):
+                chunk = text[typed:typed + chunk_size]
+                async with session.post(url, json={"text": chunk}) as response:
+                    result = await self._handle_response(response)
+                if result.get("status") == "error":
+                    return {**result, "method": "type", "typed": typed}
+                typed += len(chunk)
+            return {"status": "ok", "method": "type", "typed": typed}
         except Exception as e:
             logger.error(f"Type text error: {str(e)}")
-            return {"status": "error", "message": str(e)}
-    
+            return {"status": "error", "message": str(e), "method": "type", "typed": typed}
+
+    @queued_action()
     async def press_key(self, key):
-        """Press a keyboard key"""
-        try:
-            # Map the key to its xdotool equivalent
-            xdotool_key = map_key_to_xdotool(key)
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/key"
-                payload = {"key": xdotool_key}
-                async with session.post(url, json=payload) as response:
-                    return await self._handle_response(response)
+        """Press a key, a chord such as ctrl+shift+t, or a sequence such as "tab*3 enter"
+        
+        The whole spec is checked before anything is sent. Each key goes in its
+        own request, or a sequence goes in one request as space-separated
+        xdotool keys when key_sequences is on. Separate requests are not
+        atomic, so a failed sequence reports how many keys were pressed.
+        """
+        try:
+            chords = parse_keys(key)
+        except KeySpecError as e:
+            return {"status": "error", "message": str(e)}
+        try:
+            session = self._get_session()
+            url = f"{self.api_url}/computer-use/key"
+            if self.http_config.get("key_sequences", False):
+                groups = [" ".join(chords)]
+            else:
+                groups = chords
+            for index, group in enumerate(groups):
+                async with session.post(url, json={"key": group}) as response:
+                    result = await self._handle_response(response)
+                if result.get("status") == "error":
+                    if len(groups) > 1:
+                        result["pressed"] = chords[:index]
+                    break
+            if isinstance(result, dict):
+                result["keys"] = chords
+            return result
         except Exception as e:
             logger.error(f"Press key error: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    @queued_action()
     async def scroll(self, amount, axis='v'):
         """Scroll vertically or horizontally
         
@@ -134,90 +438,398 @@ class ComputerClient:
             axis: String. 'v' for vertical, 'h' for horizontal
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/scroll"
-                payload = {"amount": amount, "axis": axis}
-                async with session.post(url, json=payload) as response:
-                    return await self._handle_response(response)
+            session = self._get_session()
+            url = f"{self.api_url}/computer-use/scroll"
+            payload = {"amount": amount, "axis": axis}
+            async with session.post(url, json=payload) as response:
+                return await self._handle_response(response)
         except Exception as e:
             logger.error(f"Scroll error: {str(e)}")
             return {"status": "error", "message": str(e)}
 
-    async def mouse_move(self, x, y):
-        """Move the mouse cursor to the specified coordinates"""
+    @queued_action(merge=True)
+    async def mouse_move(self, x, y, transform=NATIVE_TRANSFORM):
+        """Move the mouse cursor to the specified coordinates, mapped to the native screen by the transform"""
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/mouse-move"
-                payload = {"x": x, "y": y}
-                async with session.post(url, json=payload) as response:
-                    return await self._handle_response(response)
+            session = self._get_session()
+            x, y = transform.to_screen(x, y)
+            url = f"{self.api_url}/computer-use/mouse-move"
+            payload = {"x": x, "y": y}
+            async with session.post(url, json=payload) as response:
+                return self._note_cursor(await self._handle_response(response), x, y)
         except Exception as e:
             logger.error(f"Mouse move error: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    @queued_action()
     async def right_click(self):
         """Perform a right mouse click at the current cursor position"""
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/right-click"
-                async with session.post(url) as response:
-                    return await self._handle_response(response)
+            session = self._get_session()
+            url = f"{self.api_url}/computer-use/right-click"
+            async with session.post(url) as response:
+                return await self._handle_response(response)
         except Exception as e:
             logger.error(f"Right click error: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    @queued_action()
     async def double_click(self):
         """Perform a double-click at the current cursor position"""
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/double-click"
-                async with session.post(url) as response:
-                    return await self._handle_response(response)
+            session = self._get_session()
+            url = f"{self.api_url}/computer-use/double-click"
+            async with session.post(url) as response:
+                return await self._handle_response(response)
         except Exception as e:
             logger.error(f"Double click error: {str(e)}")
             return {"status": "error", "message": str(e)}
 
-    async def drag(self, start_x, start_y, end_x, end_y, hold_ms=100):
-        """Perform a drag operation from start to end coordinates"""
-        try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/left-click-drag"
-                payload = {
-                    "startX": start_x,
-                    "startY": start_y,
-                    "endX": end_x,
-                    "endY": end_y,
-                    "holdMs": hold_ms
-                }
-                async with session.post(url, json=payload) as response:
-                    return await self._handle_response(response)
+    @queued_action()
+    async def drag(self, start_x, start_y, end_x, end_y, hold_ms=100, transform=NATIVE_TRANSFORM):
+        """Perform a drag operation from start to end coordinates, mapped to the native screen by the transform"""
+        try:
+            session = self._get_session()
+            start_x, start_y = transform.to_screen(start_x, start_y)
+            end_x, end_y = transform.to_screen(end_x, end_y)
+            url = f"{self.api_url}/computer-use/left-click-drag"
+            payload = {
+                "startX": start_x,
+                "startY": start_y,
+                "endX": end_x,
+                "endY": end_y,
+                "holdMs": hold_ms
+            }
+            async with session.post(url, json=payload) as response:
+                return self._note_cursor(await self._handle_response(response), end_x, end_y)
         except Exception as e:
             logger.error(f"Drag error: {str(e)}")
             return {"status": "error", "message": str(e)}
 
-    async def get_cursor_position(self):
-        """Get the current cursor position"""
+    async def get_cursor_position(self, refresh=False):
+        """Get the current cursor position in native screen coordinates
+        
+        The position the plugin last moved the cursor to is served locally.
+        It is checked against the API once it is older than
+        state_max_age_ms, since the cursor can also be moved from the viewer.
+        
+        Args:
+            refresh: Bypass the mirrored position and ask the API
+        """
+        max_age = self.http_config.get("state_max_age_ms", 0) / 1000
+        if not refresh and self._cursor is not None and time.monotonic() - self._cursor[2] <= max_age:
+            return {"status": "ok", "x": self._cursor[0], "y": self._cursor[1]}
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/cursor-position"
-                async with session.get(url) as response:
-                    return await self._handle_response(response)
+            session = self._get_session()
+            url = f"{self.api_url}/computer-use/cursor-position"
+            async with session.get(url) as response:
+                result = await self._handle_response(response)
         except Exception as e:
             logger.error(f"Get cursor position error: {str(e)}")
             return {"status": "error", "message": str(e)}
+        if isinstance(result.get("x"), (int, float)) and isinstance(result.get("y"), (int, float)):
+            self._note_cursor(result, result["x"], result["y"])
+        return result
+
+    def _note_cursor(self, result, x, y):
+        """Update the mirrored cursor position after a successful request, and pass its result on"""
+        if isinstance(result, dict) and result.get("status") != "error":
+            self._cursor = (x, y, time.monotonic())
+        return result
 
-    async def get_screen_size(self):
-        """Get the current screen size of the virtual desktop"""
+    def get_state(self):
+        """Get the mirrored cursor position and screen size without asking the API.
+        Either is None if not known; the cursor is in native screen coordinates.
+        """
+        cursor = None
+        if self._cursor is not None:
+            cursor = {"x": self._cursor[0], "y": self._cursor[1],
+                      "age_ms": round((time.monotonic() - self._cursor[2]) * 1000)}
+        screen_size = None
+        if self._screen_size is not None and self._screen_size.get("status") == "ok":
+            screen_size = {"width": self._screen_size.get("width"), "height": self._screen_size.get("height")}
+        return {"cursor": cursor, "screen_size": screen_size}
+
+    async def get_screen_size(self, refresh=False):
+        """Get the current screen size of the virtual desktop
+        
+        The size is cached until invalidated or a screenshot shows a new
+        resolution. Failures are cached briefly so a stopped container is not
+        asked again on every call.
+        
+        Args:
+            refresh: Bypass the cache and ask the API
+        """
+        cached = self._screen_size
+        if not refresh and cached is not None:
+            if cached.get("status") == "ok" or time.monotonic() < self._screen_size_expires:
+                return dict(cached)
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.api_url}/computer-use/screen-size"
-                async with session.get(url) as response:
-                    return await self._handle_response(response)
+            session = self._get_session()
+            url = f"{self.api_url}/computer-use/screen-size"
+            async with session.get(url) as response:
+                result = await self._handle_response(response)
         except Exception as e:
             logger.error(f"Get screen size error: {str(e)}")
-            return {"status": "error", "message": str(e)}
+            result = {"status": "error", "message": str(e)}
+        self._screen_size = result
+        self._screen_size_expires = time.monotonic() + SCREEN_SIZE_ERROR_TTL
+        return dict(result)
+
+    def invalidate_screen_size(self):
+        """Forget the cached screen size, e.g. when the container starts or stops"""
+        self._screen_size = None
+
+    def invalidate_state(self):
+        """Forget the mirrored screen size and cursor position"""
+        self.invalidate_screen_size()
+        self._cursor = None
+
+    def _note_screen_size(self, width, height):
+        """Update the cached screen size from the size of a captured frame"""
+        cached = self._screen_size
+        if cached is None or cached.get("status") != "ok" or \
+                (cached.get("width"), cached.get("height")) != (width, height):
+            self._screen_size = {"status": "ok", "width": width, "height": height}
+
+    async def wait_until_ready(self, timeout=60, initial_delay=0.05, max_delay=2.0, probe_timeout=2.0):
+        """Poll the API until the desktop answers, backing off exponentially.
+        
+        Args:
+            timeout: Overall deadline in seconds
+            initial_delay: Seconds to wait after the first failed probe
+            max_delay: Upper bound for the delay between probes
+            probe_timeout: Seconds allowed for each probe request
+            
+        Returns:
+            Dict with status, the measured startup time in milliseconds and
+            the number of probes made
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + timeout
+        delay = initial_delay
+        attempts = 0
+        last_error = None
+        url = f"{self.api_url}/computer-use/screen-size"
+        while True:
+            attempts += 1
+            try:
+                session = self._get_session()
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=probe_timeout)) as response:
+                    if response.status == 200:
+                        if attempts > 1:
+                            metrics.HTTP_RETRIES.inc(attempts - 1, endpoint="screen-size", container=self.api_url)
+                        return {
+                            "status": "ok",
+                            "startup_ms": round((loop.time() - started) * 1000),
+                            "attempts": attempts
+                        }
+                    last_error = f"status {response.status}"
+            except Exception as e:
+                last_error = str(e) or type(e).__name__
+            
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                metrics.HTTP_RETRIES.inc(attempts - 1, endpoint="screen-size", container=self.api_url)
+                return {
+                    "status": "error",
+                    "message": f"Desktop not ready after {timeout}s ({attempts} probes, last error: {last_error})",
+                    "attempts": attempts
+                }
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+    async def wait_for_change(self, timeout=5.0, threshold=0.001, region=None, interval=0.1, settings=None):
+        """Poll screenshots until the screen differs from how it looked at the start.
+        
+        Args:
+            timeout: Seconds to wait for a change
+            threshold: Fraction of pixels that must change
+            region: Optional dict with x, y, width and height to watch
+            interval: Seconds between captures
+            settings: Screenshot encoding settings used for every capture
+            
+        Returns:
+            Tuple of (final frame, dict with status "changed" or "timeout",
+            elapsed_ms and the measured difference), or (None, error dict)
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        img = await self.get_screenshot(settings, max_age=0)
+        if img is None:
+            return None, {"status": "error", "message": "Failed to get screenshot"}
+        baseline = frame_array(img, region)
+        difference = 0.0
+        while loop.time() - started < timeout:
+            await asyncio.sleep(interval)
+            img = await self.get_screenshot(settings, max_age=0)
+            if img is None:
+                return None, {"status": "error", "message": "Failed to get screenshot"}
+            difference = changed_fraction(baseline, frame_array(img, region))
+            if difference > threshold:
+                return img, {"status": "changed", "elapsed_ms": round((loop.time() - started) * 1000),
+                             "difference": round(difference, 4)}
+        return img, {"status": "timeout", "elapsed_ms": round((loop.time() - started) * 1000),
+                     "difference": round(difference, 4)}
+
+    async def wait_until_idle(self, stable_time=0.5, timeout=10.0, threshold=0.0, region=None, interval=0.1,
+                              settings=None):
+        """Poll screenshots until the screen has stopped changing for stable_time seconds.
+        
+        Args:
+            stable_time: Seconds the screen must stay unchanged
+            timeout: Seconds to wait before giving up
+            threshold: Fraction of changed pixels still treated as unchanged
+            region: Optional dict with x, y, width and height to watch
+            interval: Seconds between captures
+            settings: Screenshot encoding settings used for every capture
+            
+        Returns:
+            Tuple of (final frame, dict with status "idle" or "timeout" and
+            elapsed_ms), or (None, error dict)
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        img = await self.get_screenshot(settings, max_age=0)
+        if img is None:
+            return None, {"status": "error", "message": "Failed to get screenshot"}
+        previous = frame_array(img, region)
+        stable_since = loop.time()
+        while loop.time() - stable_since < stable_time:
+            if loop.time() - started >= timeout:
+                return img, {"status": "timeout", "elapsed_ms": round((loop.time() - started) * 1000)}
+            await asyncio.sleep(interval)
+            img = await self.get_screenshot(settings, max_age=0)
+            if img is None:
+                return None, {"status": "error", "message": "Failed to get screenshot"}
+            current = frame_array(img, region)
+            if changed_fraction(previous, current) > threshold:
+                stable_since = loop.time()
+            previous = current
+        return img, {"status": "idle", "elapsed_ms": round((loop.time() - started) * 1000)}
+
+    @queued_action()
+    async def batch(self, actions, transform=NATIVE_TRANSFORM):
+        """Run several actions back to back, stopping at the first error.
+        
+        Args:
+            actions: List of dicts, each with an "action" name from BATCH_ACTIONS
+                     (or "wait"), the action's arguments, and an optional
+                     "delay_ms" to pause after the step
+            transform: ScreenTransform for the coordinates of pointer steps
+        
+        Returns:
+            Dict with the overall status, the number of completed steps and
+            the result of each step that ran
+        """
+        results = []
+        for index, step in enumerate(actions):
+            step = dict(step)
+            name = step.pop("action", None)
+            delay_ms = step.pop("delay_ms", 0)
+            if name == "wait":
+                result = {"status": "ok"}
+                delay_ms = max(delay_ms, step.get("ms", 0))
+            elif name in BATCH_ACTIONS:
+                if name in POINTER_ACTIONS:
+                    step["transform"] = transform
+                try:
+                    # The batch already holds the action queue, so steps run directly
+                    result = await getattr(type(self), BATCH_ACTIONS[name]).__wrapped__(self, **step)
+                except TypeError as e:
+                    result = {"status": "error", "message": f"Invalid arguments for {name}: {str(e)}"}
+            else:
+                result = {"status": "error", "message": f"Unknown action: {name}"}
+            
+            results.append({"action": name, "result": result})
+            if isinstance(result, dict) and result.get("status") == "error":
+                return {
+                    "status": "error",
+                    "message": f"Step {index} ({name}) failed: {result.get('message')}",
+                    "completed": index,
+                    "results": results
+                }
+            if delay_ms:
+                await asyncio.sleep(delay_ms / 1000)
+        
+        return {"status": "ok", "completed": len(results), "results": results}
+
+def get_client_for_url(api_url):
+    """Get the shared computer client for an API endpoint, creating it on first use"""
+    client = _clients.get(api_url)
+    if client is None:
+        config = _get_config()
+        http_config = {**DEFAULT_HTTP_CONFIG, **config.get('http', {})}
+        client = ComputerClient(api_url, http_config)
+        _clients[api_url] = client
+    return client
+
+def get_api_url(context=None):
+    """Get the API URL of the session's container.
+    Sessions with a pool container use its API, others use the configured api_url.
+    """
+    api_url = _session_api_urls.get(getattr(context, "log_id", None))
+    return api_url or _get_config()['api_url']
 
 @service()
 async def get_computer_client(context=None):
-    """Get a configured computer client instance"""
-    return ComputerClient()
+    """Get the shared computer client for the session's container"""
+    session_id = getattr(context, "log_id", None)
+    if session_id in _session_api_urls:
+        _session_last_used[session_id] = time.monotonic()
+    return get_client_for_url(get_api_url(context))
+
+def set_session_api_url(session_id, api_url):
+    """Point a session's client at the API of its own container"""
+    _session_api_urls[session_id] = api_url
+    _session_last_used[session_id] = time.monotonic()
+    _released_sessions.pop(session_id, None)
+
+def clear_session_api_url(session_id, idle=False):
+    """Point a session back at the configured api_url.
+    
+    Args:
+        session_id: The chat session
+        idle: The session's container was taken away for being idle, so its
+              commands must not fall through to the shared container
+    """
+    _session_api_urls.pop(session_id, None)
+    _session_last_used.pop(session_id, None)
+    if idle:
+        _released_sessions[session_id] = True
+        while len(_released_sessions) > MAX_TRACKED_SESSIONS:
+            _released_sessions.popitem(last=False)
+
+def session_released(session_id):
+    """Check whether a session's pool container was released for being idle"""
+    return session_id in _released_sessions
+
+def session_last_used(session_id):
+    """Get when a session last used its client (time.monotonic), or None"""
+    return _session_last_used.get(session_id)
+
+def invalidate_screen_sizes():
+    """Forget the mirrored screen size and cursor position of every shared client"""
+    for client in _clients.values():
+        client.invalidate_state()
+
+async def close_computer_client(api_url):
+    """Close the shared client for one API endpoint"""
+    client = _clients.pop(api_url, None)
+    if client is not None:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.error(f"Failed to close computer client {api_url}: {str(e)}")
+
+async def close_computer_clients():
+    """Close all shared clients, including those of pool containers, when the plugin unloads"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.error(f"Failed to close computer client {client.api_url}: {str(e)}")
+
@@ -0,0 +1,277 @@
+from lib.providers.services import service
+import asyncio
+import logging
+import time
+import uuid
+from .docker_control import (_get_config, _get_docker, _run_docker, ensure_image_available, DockerException,
+                             DEFAULT_POOL_CONFIG, DEFAULT_READINESS_CONFIG)
+from .computer_client import (get_client_for_url, close_computer_client, set_session_api_url,
+                              clear_session_api_url, session_last_used)
+from .screenshot_history import clear_history
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Label marking containers created by the pool
+POOL_LABEL = "mindroot_computer_use.pool"
+
+# Container ports of the web desktop and the Computer Use API
+DESKTOP_PORT = "3000/tcp"
+API_PORT = "3100/tcp"
+
+def _get_pool_config():
+    """Get the pool settings merged over the defaults"""
+    return {**DEFAULT_POOL_CONFIG, **_get_config().get("pool", {})}
+
+def is_pool_enabled():
+    """Check whether sessions get their own containers from the pool"""
+    return bool(_get_pool_config()["enabled"])
+
+class PooledContainer:
+    """A pool container and the host ports its services are published on"""
+    def __init__(self, container, host):
+        self.container = container
+        self.session_id = None
+        self.ports = {}
+        for container_port, bindings in (container.ports or {}).items():
+            if bindings:
+                self.ports[container_port.split('/')[0]] = int(bindings[0]["HostPort"])
+        self.api_url = f"http://{host}:{self.ports[API_PORT.split('/')[0]]}"
+        self.desktop_url = f"http://{host}:{self.ports[DESKTOP_PORT.split('/')[0]]}"
+
+    def describe(self):
+        """Get the details reported to callers"""
+        return {
+            "container_id": self.container.id,
+            "name": self.container.name,
+            "ports": self.ports,
+            "api_url": self.api_url,
+            "desktop_url": self.desktop_url
+        }
+
+class ContainerPool:
+    """Keeps started containers ready and hands one to each chat session.
+
+    Containers get dynamic host ports, so any number of sessions can run
+    side by side. Released containers are destroyed and replaced, and a
+    background task releases containers whose session has gone idle.
+    """
+    def __init__(self):
+        self.warm = []
+        self.assigned = {}
+        self.starting = 0
+        self._lock = asyncio.Lock()
+        self._fill_task = None
+        self._reaper = None
+
+    @property
+    def total(self):
+        """Number of containers in the pool, including ones being started"""
+        return len(self.warm) + len(self.assigned) + self.starting
+
+    async def start(self):
+        """Remove containers left over from earlier runs and start filling the pool"""
+        if self._reaper is not None:
+            return
+        self._reaper = asyncio.create_task(self._reap_loop())
+        await self._remove_stale()
+        self._schedule_fill()
+
+    async def _remove_stale(self):
+        """Remove pool containers that belonged to a previous server run"""
+        try:
+            client = await _get_docker()
+            stale = await _run_docker(client.containers.list, all=True, filters={"label": POOL_LABEL})
+            for container in stale:
+                await _run_docker(container.remove, force=True, operation="stop")
+        except Exception as e:
+            logger.error(f"Failed to remove stale pool containers: {str(e)}")
+
+    def _schedule_fill(self):
+        """Start topping up the warm pool in the background"""
+        if self._fill_task is None or self._fill_task.done():
+            self._fill_task = asyncio.create_task(self._fill())
+
+    async def _fill(self):
+        """Start containers until the warm pool has the configured size"""
+        while True:
+            config = _get_pool_config()
+            async with self._lock:
+                if len(self.warm) + self.starting >= config["size"] or self.total >= config["max_size"]:
+                    return
+                self.starting += 1
+            try:
+                pooled = await self._create(config)
+            except Exception as e:
+                self.starting -= 1
+                logger.error(f"Failed to start pool container: {str(e)}")
+                return
+            self.starting -= 1
+            self.warm.append(pooled)
+
+    async def _create(self, config):
+        """Create a container with dynamic host ports and wait until its desktop answers"""
+        image_result = await ensure_image_available()
+        if image_result["status"] != "ok":
+            raise DockerException(image_result["message"])
+        base_config = _get_config()
+        client = await _get_docker()
+        container = await _run_docker(
+            client.containers.run,
+            base_config['docker_image'],
+            name=f"{base_config['container_name']}_pool_{uuid.uuid4().hex[:8]}",
+            ports={container_port: None for container_port in base_config['ports']},
+            labels={POOL_LABEL: "1"},
+            detach=True,
+            operation="start"
+        )
+        # The host ports are only known once Docker has assigned them
+        await _run_docker(container.reload)
+        pooled = PooledContainer(container, config["host"])
+        await self._wait_ready(pooled)
+        return pooled
+
+    async def _wait_ready(self, pooled):
+        """Wait for a container's desktop, destroying the container if it never answers"""
+        readiness = {**DEFAULT_READINESS_CONFIG, **_get_config().get("readiness", {})}
+        ready = await get_client_for_url(pooled.api_url).wait_until_ready(**readiness)
+        if ready["status"] != "ok":
+            await self._destroy(pooled)
+            raise DockerException(ready["message"])
+
+    async def _destroy(self, pooled):
+        """Remove a container, close its client and drop its metrics"""
+        await close_computer_client(pooled.api_url)
+        metrics.forget_container(pooled.api_url)
+        try:
+            await _run_docker(pooled.container.remove, force=True, operation="stop")
+        except Exception as e:
+            logger.error(f"Failed to remove pool container {pooled.container.name}: {str(e)}")
+
+    async def acquire(self, session_id):
+        """Get the container for a session, handing it a warm one if it has none"""
+        await self.start()
+        config = _get_pool_config()
+        async with self._lock:
+            pooled = self.assigned.get(session_id)
+            if pooled is None and self.warm:
+                pooled = self.warm.pop(0)
+                pooled.session_id = session_id
+                self.assigned[session_id] = pooled
+            elif pooled is None:
+                if self.total >= config["max_size"]:
+                    raise DockerException(f"Container pool is full ({config['max_size']} containers)")
+                self.starting += 1
+
+        if pooled is None:
+            # No warm container left, so this session pays for a cold start
+            try:
+                pooled = await self._create(config)
+            finally:
+                self.starting -= 1
+            pooled.session_id = session_id
+            self.assigned[session_id] = pooled
+
+        set_session_api_url(session_id, pooled.api_url)
+        self._schedule_fill()
+        return pooled
+
+    async def release(self, session_id, idle=False):
+        """Take a session's container back and destroy it.
+        Containers are never reused, as restarting one keeps the previous
+        session's files, browser profile and logins.
+        
+        Args:
+            session_id: The chat session
+            idle: Released by the reaper; the session's commands then fail
+                  until it runs computer_start again
+        """
+        async with self._lock:
+            pooled = self.assigned.pop(session_id, None)
+        if pooled is None:
+            return False
+        clear_session_api_url(session_id, idle)
+        clear_history(session_id)
+        await self._destroy(pooled)
+        self._schedule_fill()
+        return True
+
+    async def reap_idle(self):
+        """Release containers of idle sessions and trim surplus warm containers"""
+        config = _get_pool_config()
+        now = time.monotonic()
+        for session_id in list(self.assigned):
+            last_used = session_last_used(session_id)
+            if last_used is None or now - last_used > config["idle_timeout"]:
+                logger.info(f"Releasing idle pool container of session {session_id}")
+                await self.release(session_id, idle=True)
+        while len(self.warm) > config["size"]:
+            await self._destroy(self.warm.pop())
+
+    async def _reap_loop(self):
+        """Check for idle sessions periodically"""
+        while True:
+            await asyncio.sleep(_get_pool_config()["reap_interval"])
+            try:
+                await self.reap_idle()
+            except Exception as e:
+                logger.error(f"Pool reaper error: {str(e)}")
+
+    async def shutdown(self):
+        """Stop the background tasks and remove every pool container"""
+        for task in (self._reaper, self._fill_task):
+            if task is not None:
+                task.cancel()
+        self._reaper = None
+        self._fill_task = None
+        for session_id in list(self.assigned):
+            clear_session_api_url(session_id)
+        containers = self.warm + list(self.assigned.values())
+        self.warm = []
+        self.assigned = {}
+        for pooled in containers:
+            await self._destroy(pooled)
+
+    def status(self):
+        """Get the number of warm, assigned and starting containers"""
+        return {
+            "warm": len(self.warm),
+            "assigned": len(self.assigned),
+            "starting": self.starting,
+            "max_size": _get_pool_config()["max_size"]
+        }
+
+# The pool shared by all sessions
+_pool = ContainerPool()
+
+@service()
+async def acquire_computer_container(context=None):
+    """Get a container from the pool for the current session"""
+    session_id = getattr(context, "log_id", None)
+    try:
+        pooled = await _pool.acquire(session_id)
+        return {"status": "ok", **pooled.describe()}
+    except Exception as e:
+        logger.error(f"Pool acquire failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@service()
+async def release_computer_container(context=None):
+    """Return the current session's container to the pool"""
+    session_id = getattr(context, "log_id", None)
+    try:
+        if await _pool.release(session_id):
+            return {"status": "ok"}
+        return {"status": "not_found"}
+    except Exception as e:
+        logger.error(f"Pool release failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@service()
+async def get_computer_pool_status(context=None):
+    """Get the number of warm, assigned and starting pool containers"""
+    return {"status": "ok", **_pool.status()}
+
+async def shutdown_computer_pool():
+    """Remove all pool containers, e.g. when the server shuts down"""
+    await _pool.shutdown()
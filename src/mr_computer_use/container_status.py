@@ -0,0 +1,128 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+from .docker_control import _get_config, _get_docker, _run_docker, get_computer_container_status
+
+logger = logging.getLogger(__name__)
+
+# Container status for each Docker event action we care about
+EVENT_STATUSES = {
+    "create": "stopped",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "stopped",
+    "die": "stopped",
+    "stop": "stopped",
+    "kill": "stopped",
+    "destroy": "not_created",
+}
+
+# Max status updates buffered for a slow subscriber before old ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 10
+
+# Latest known status of the Computer Use container
+_status = {"status": "unknown"}
+
+# Queues of the clients currently subscribed to status changes
+_subscribers = set()
+
+# Task following the Docker event stream, and the stream it is reading
+_watcher = None
+_events = None
+
+# The event stream blocks a thread for as long as it is open
+_events_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mr_computer_use_events")
+
+def get_cached_status():
+    """Get the latest known container status without asking Docker"""
+    return dict(_status)
+
+def _set_status(status):
+    """Update the cached status and notify subscribers if it changed"""
+    global _status
+    if status == _status:
+        return
+    _status = status
+    for queue in list(_subscribers):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(dict(status))
+
+def _handle_event(event):
+    """Update the status from a Docker container event"""
+    # The events filter matches name prefixes, which would include pool containers
+    name = (event.get("Actor") or {}).get("Attributes", {}).get("name")
+    if name != _get_config()['container_name']:
+        return
+    action = (event.get("Action") or event.get("status") or "").split(":")[0]
+    status = EVENT_STATUSES.get(action)
+    if status:
+        _set_status({"status": status})
+
+def _pump_events(events, loop):
+    """Forward events from the blocking Docker event stream to the event loop"""
+    for event in events:
+        loop.call_soon_threadsafe(_handle_event, event)
+
+async def _watch_container_events():
+    """Follow Docker events for the container, reconnecting with backoff"""
+    global _events
+    loop = asyncio.get_running_loop()
+    delay = 1
+    while True:
+        try:
+            client = await _get_docker()
+            name = _get_config()['container_name']
+            _events = await _run_docker(client.events, decode=True,
+                                        filters={"type": "container", "container": name})
+            # Read the current status after subscribing so no change is missed
+            status = await get_computer_container_status()
+            if status["status"] == "error":
+                status["status"] = "docker_error"
+            _set_status(status)
+            delay = 1
+            await loop.run_in_executor(_events_executor, _pump_events, _events, loop)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Docker event stream error: {str(e)}")
+            _set_status({"status": "docker_error", "message": str(e)})
+        finally:
+            if _events is not None:
+                _events.close()
+                _events = None
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30)
+
+async def ensure_status_watcher():
+    """Start following Docker events if not already, and wait for the first status"""
+    global _watcher
+    if _watcher is None or _watcher.done():
+        _watcher = asyncio.create_task(_watch_container_events())
+    if _status["status"] == "unknown":
+        status = await get_computer_container_status()
+        if status["status"] == "error":
+            status["status"] = "docker_error"
+        _set_status(status)
+
+async def stop_status_watcher():
+    """Stop following Docker events"""
+    global _watcher
+    if _watcher is not None:
+        _watcher.cancel()
+        try:
+            await _watcher
+        except asyncio.CancelledError:
+            pass
+        _watcher = None
+
+def subscribe():
+    """Get a queue that receives every future status change"""
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    _subscribers.add(queue)
+    return queue
+
+def unsubscribe(queue):
+    """Stop sending status changes to a queue"""
+    _subscribers.discard(queue)
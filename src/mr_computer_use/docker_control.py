@@ -1,11 +1,98 @@
 from lib.providers.services import service
+from concurrent.futures import ThreadPoolExecutor
 import docker
+import asyncio
+import functools
 import os
+import time
 import logging
 import json
 
 logger = logging.getLogger(__name__)
 
+# HTTP connection pool settings for the Computer Use API client
+DEFAULT_HTTP_CONFIG = {
+    "pool_limit": 10,  # Max pooled connections per endpoint
+    "keepalive_timeout": 30,  # Seconds an idle connection is kept open
+    "connect_timeout": 5,  # Seconds to wait for a connection
+    "total_timeout": 60,  # Seconds allowed for a whole request
+    "screenshot_reuse_ms": 100,  # Reuse a frame this recent, if no action was sent since (0 = off)
+    "fused_click": False,  # Send click coordinates with the left-click request (the server must support it)
+    "key_sequences": False,  # Send a key sequence in one request as space-separated xdotool keys
+    "state_max_age_ms": 5000  # Serve the mirrored cursor position for this long before asking the API again
+}
+
+# Screenshot encoding settings, can be overridden per agent under "agents"
+DEFAULT_SCREENSHOT_CONFIG = {
+    "max_width": None,  # Downscale screenshots wider than this
+    "max_height": None,  # Downscale screenshots taller than this
+    "format": "png",  # Output format: png, jpeg or webp
+    "quality": 80,  # JPEG/WebP quality (1-100)
+    "grayscale": False,  # Convert screenshots to grayscale
+    "skip_unchanged": True,  # Reply "screen unchanged" instead of resending an identical frame
+    "unchanged_threshold": 0.0,  # Fraction of changed pixels still treated as unchanged
+    "settle_ms": 0,  # Wait for the screen to be stable this long before post-action captures (0 = off)
+    "settle_timeout_ms": 3000,  # Give up waiting for the screen to settle after this long
+    "async_capture": False,  # Return action results at once and add the screenshot to the chat when it is ready
+    "capture_delay_ms": 0  # Wait this long after an action before an async capture starts
+}
+
+# How computer_start waits for the desktop API to answer
+DEFAULT_READINESS_CONFIG = {
+    "timeout": 60,  # Seconds to wait before giving up on the desktop
+    "initial_delay": 0.05,  # Seconds between the first probes
+    "max_delay": 2.0,  # Upper bound for the backoff between probes
+    "probe_timeout": 2.0  # Seconds allowed for each probe request
+}
+
+# Seconds allowed for each kind of blocking Docker operation
+DEFAULT_DOCKER_TIMEOUTS = {
+    "default": 30,  # Quick calls like listing containers
+    "pull": 1800,  # Pulling the image from Docker Hub
+    "clone": 300,  # Cloning the server repo before a build
+    "build": 3600,  # Building the image
+    "start": 120,  # Creating or starting the container
+    "stop": 60  # Stopping the container
+}
+
+# Warm pool of per-session containers, used instead of the single shared container when enabled
+DEFAULT_POOL_CONFIG = {
+    "enabled": False,  # Give each chat session its own container from the pool
+    "size": 2,  # Started containers kept ready for new sessions
+    "max_size": 8,  # Max containers in the pool, warm and assigned
+    "idle_timeout": 600,  # Seconds before an unused session's container is released
+    "reap_interval": 60,  # Seconds between idle checks
+    "host": "localhost"  # Host the container ports are published on
+}
+
+# Instrumentation settings
+DEFAULT_METRICS_CONFIG = {
+    "slow_call_ms": 0  # Log commands and API requests slower than this (0 = off)
+}
+
+# Recent screenshots kept for each chat session
+DEFAULT_HISTORY_CONFIG = {
+    "enabled": True,
+    "max_frames": 30,  # Steps remembered per session
+    "max_bytes": 16000000,  # Encoded bytes kept per session, identical frames counted once
+    "max_sessions": 20  # Sessions with a history; the least recently used is dropped
+}
+
+# How screenshots already in the chat are sent to the model on later turns
+DEFAULT_CONTEXT_CONFIG = {
+    "keep_screenshots": 3,  # Most recent images sent at full size
+    "old_screenshots": "thumbnail",  # Older images: "thumbnail", "placeholder" or "keep"
+    "thumbnail_size": 256,  # Max width and height of thumbnails
+    "thumbnail_quality": 60  # JPEG quality of thumbnails
+}
+
+# How computer_type enters text
+DEFAULT_TYPING_CONFIG = {
+    "paste_min_length": 200,  # Paste text at least this long through the clipboard instead of typing it
+    "chunk_size": 200,  # Characters sent per request when typing
+    "paste_key": "ctrl+v"  # Key pressed to paste from the clipboard
+}
+
 # Configuration with defaults
 DEFAULT_CONFIG = {
     "docker_image": "runvnc/mr-computer-use:latest",  # Pre-built Docker Hub image
@@ -15,9 +102,31 @@ DEFAULT_CONFIG = {
         "3100/tcp": 3100  # Computer Use API
     },
     "build_if_not_found": True,  # Whether to attempt building if image not found
-    "repo_url": "https://github.com/runvnc/mr_computer_use_server.git"
+    "snapshot_image": "mindroot_computer_use_snapshot:latest",  # Known-good desktop state used by computer_reset
+    "snapshot_on_first_boot": True,  # Take the snapshot when a new container has finished booting
+    "repo_url": "https://github.com/runvnc/mr_computer_use_server.git",
+    "api_url": "http://localhost:3100",  # Computer Use API endpoint
+    "http": DEFAULT_HTTP_CONFIG,
+    "screenshot": DEFAULT_SCREENSHOT_CONFIG,
+    "readiness": DEFAULT_READINESS_CONFIG,
+    "docker_timeouts": DEFAULT_DOCKER_TIMEOUTS,
+    "pool": DEFAULT_POOL_CONFIG,
+    "metrics": DEFAULT_METRICS_CONFIG,
+    "history": DEFAULT_HISTORY_CONFIG,
+    "context": DEFAULT_CONTEXT_CONFIG,
+    "typing": DEFAULT_TYPING_CONFIG,
+    "agents": {}  # Per-agent overrides, e.g. {"my_agent": {"screenshot": {...}}}
 }
 
+# Parsed user config file, reloaded only when its modification time changes
+_user_config_cache = {"mtime": None, "config": {}}
+
+def _name_filter(config):
+    """Docker filter matching exactly the configured container name.
+    A plain name filter matches substrings, which would include pool containers.
+    """
+    return {"name": f"^/?{config['container_name']}$"}
+
 def _get_config():
     """Get configuration, with user overrides if available"""
     config = DEFAULT_CONFIG.copy()
@@ -26,23 +135,97 @@ def _get_config():
     config_path = os.path.expanduser("~/.mindroot/computer_use_config.json")
     try:
         if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                user_config = json.load(f)
-                config.update(user_config)
+            mtime = os.path.getmtime(config_path)
+            if mtime != _user_config_cache["mtime"]:
+                with open(config_path, 'r') as f:
+                    _user_config_cache["config"] = json.load(f)
+                _user_config_cache["mtime"] = mtime
+            config.update(_user_config_cache["config"])
     except Exception as e:
         logger.error(f"Failed to load configuration: {str(e)}")
     
     return config
 
+# Removes runtime files of a running desktop from a snapshot: X server locks
+# and sockets, pid files and browser profile locks
+SNAPSHOT_CLEANUP_COMMAND = (
+    "rm -rf /tmp/.X*-lock /tmp/.X11-unix/X* /tmp/*.pid /run/*.pid /var/run/*.pid /run/dbus/pid; "
+    "find /root /home /tmp -xdev \\( -name 'Singleton*' -o -name parent.lock -o -name .parentlock \\) "
+    "-exec rm -f {} + 2>/dev/null; true"
+)
+
 class DockerException(Exception):
     pass
 
+# Shared docker-py client, created on first use
+_docker_client = None
+
+# docker-py is blocking, so its calls run on these threads instead of the event loop
+_docker_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mr_computer_use_docker")
+
+def _get_docker_client():
+    """Get the shared docker-py client, creating it on first use"""
+    global _docker_client
+    if _docker_client is None:
+        _docker_client = docker.from_env()
+    return _docker_client
+
+def _get_timeout(operation):
+    """Get the timeout in seconds for a kind of Docker operation"""
+    config = _get_config()
+    timeouts = {**DEFAULT_DOCKER_TIMEOUTS, **config.get("docker_timeouts", {})}
+    return timeouts.get(operation, timeouts["default"])
+
+async def _run_docker(func, *args, operation="default", **kwargs):
+    """Run a blocking docker-py call in the Docker executor.
+    
+    The caller is released when the timeout expires or the awaiting task is
+    cancelled. The call itself can't be interrupted and finishes in the
+    background, but it no longer holds up the event loop.
+    
+    Args:
+        func: The docker-py function or method to call
+        operation: Kind of operation, selects the timeout from "docker_timeouts"
+    """
+    loop = asyncio.get_running_loop()
+    timeout = _get_timeout(operation)
+    call = functools.partial(func, *args, **kwargs)
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(_docker_executor, call), timeout)
+    except asyncio.TimeoutError:
+        raise DockerException(f"Docker {operation} operation timed out after {timeout}s")
+
+async def _get_docker():
+    """Get the shared docker-py client without blocking the event loop"""
+    if _docker_client is not None:
+        return _docker_client
+    return await _run_docker(_get_docker_client)
+
+async def _git_clone(repo_url, repo_path):
+    """Clone a git repository without blocking the event loop"""
+    timeout = _get_timeout("clone")
+    process = await asyncio.create_subprocess_exec(
+        "git", "clone", repo_url, repo_path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        process.kill()
+        await process.wait()
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        raise DockerException(f"git clone timed out after {timeout}s")
+    if process.returncode != 0:
+        raise DockerException(f"git clone failed: {stderr.decode(errors='replace').strip()}")
+
 @service()
 async def check_docker(context=None):
     """Check if Docker is installed and running"""
     try:
-        client = docker.from_env()
-        return {"status": "ok", "version": client.version()}
+        client = await _get_docker()
+        return {"status": "ok", "version": await _run_docker(client.version)}
     except Exception as e:
         logger.error(f"Docker check failed: {str(e)}")
         return {"status": "error", "message": str(e)}
@@ -52,17 +235,19 @@ async def build_computer_image(context=None):
     """Build the Computer Use Docker image"""
     config = _get_config()
     try:
-        client = docker.from_env()
+        client = await _get_docker()
         # Clone the repo if not already present
         repo_path = "/tmp/mr_computer_use_server"
         if not os.path.exists(repo_path):
-            os.system(f"git clone {config['repo_url']} {repo_path}")
+            await _git_clone(config['repo_url'], repo_path)
         
         # Build the image
-        image, logs = client.images.build(
+        image, logs = await _run_docker(
+            client.images.build,
             path=repo_path,
             tag=config['docker_image'],
-            rm=True
+            rm=True,
+            operation="build"
         )
         return {"status": "ok", "image_id": image.id}
     except Exception as e:
@@ -74,15 +259,15 @@ async def ensure_image_available(context=None):
     """Ensure the Docker image is available, pulling or building if necessary"""
     config = _get_config()
     try:
-        client = docker.from_env()
+        client = await _get_docker()
         try:
             # Try to get the image
-            image = client.images.get(config['docker_image'])
+            image = await _run_docker(client.images.get, config['docker_image'])
             return {"status": "ok", "image_id": image.id, "source": "local"}
         except docker.errors.ImageNotFound:
             # Try to pull the image from Docker Hub
             try:
-                image = client.images.pull(config['docker_image'])
+                image = await _run_docker(client.images.pull, config['docker_image'], operation="pull")
                 return {"status": "ok", "image_id": image.id, "source": "pulled"}
             except Exception as pull_error:
                 if config['build_if_not_found']:
@@ -106,14 +291,15 @@ async def start_computer_container(context=None):
     """Start a Computer Use container"""
     config = _get_config()
     try:
-        client = docker.from_env()
+        client = await _get_docker()
         # Check if container already exists
-        existing = client.containers.list(all=True, filters={"name": config['container_name']})
+        existing = await _run_docker(client.containers.list, all=True, filters=_name_filter(config))
+        created = False
         
         if existing:
             container = existing[0]
             if container.status != "running":
-                container.start()
+                await _run_docker(container.start, operation="start")
         else:
             # Ensure image is available
             image_result = await ensure_image_available(context)
@@ -124,11 +310,14 @@ async def start_computer_container(context=None):
             print("Starting docker container with ports", config['ports'])
 
             # Create and start new container
-            container = client.containers.run(
+            created = True
+            container = await _run_docker(
+                client.containers.run,
                 config['docker_image'],
                 name=config['container_name'],
                 ports=config['ports'],
-                detach=True
+                detach=True,
+                operation="start"
             )
             
         ports = {}
@@ -138,7 +327,8 @@ async def start_computer_container(context=None):
         return {
             "status": "ok", 
             "container_id": container.id,
-            "ports": ports
+            "ports": ports,
+            "created": created
         }
     except Exception as e:
         logger.error(f"Container start failed: {str(e)}")
@@ -149,14 +339,137 @@ async def stop_computer_container(context=None):
     """Stop the Computer Use container"""
     config = _get_config()
     try:
-        client = docker.from_env()
-        containers = client.containers.list(filters={"name": config['container_name']})
+        client = await _get_docker()
+        containers = await _run_docker(client.containers.list, filters=_name_filter(config))
         
         if containers:
             container = containers[0]
-            container.stop()
+            await _run_docker(container.stop, operation="stop")
             return {"status": "ok"}
         return {"status": "not_found"}
     except Exception as e:
         logger.error(f"Container stop failed: {str(e)}")
         return {"status": "error", "message": str(e)}
+
+@service()
+async def get_computer_container_status(context=None):
+    """Get whether the Computer Use container is running, stopped or not created"""
+    config = _get_config()
+    try:
+        client = await _get_docker()
+        containers = await _run_docker(client.containers.list, all=True, filters=_name_filter(config))
+        if not containers:
+            return {"status": "not_created"}
+        if containers[0].status == "running":
+            return {"status": "running"}
+        return {"status": "stopped"}
+    except Exception as e:
+        logger.error(f"Status check error: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+def _startup_config(container_config):
+    """Get how a container or image starts: its entrypoint, command and user.
+    Missing values become empty ones, and root is written as the empty user.
+    """
+    container_config = container_config or {}
+    user = container_config.get("User") or ""
+    return {
+        "Entrypoint": container_config.get("Entrypoint") or [],
+        "Cmd": container_config.get("Cmd") or [],
+        "User": "" if user in ("root", "0") else user
+    }
+
+@service()
+async def snapshot_computer_container(context=None):
+    """Save the Computer Use container's current state as the snapshot image used by reset.
+    
+    Runtime files of the running desktop (X server locks and sockets, pid
+    files, browser profile locks) are removed from the snapshot, so a
+    container started from it can bring up its display and browser again.
+    """
+    config = _get_config()
+    try:
+        client = await _get_docker()
+        containers = await _run_docker(client.containers.list, filters=_name_filter(config))
+        if not containers:
+            return {"status": "not_found"}
+        repository, _, tag = config['snapshot_image'].rpartition(':')
+        if not repository:
+            repository, tag = tag, "latest"
+        desktop = containers[0]
+        await _run_docker(desktop.commit, repository=repository, tag=tag, operation="build")
+        
+        # Clean the committed filesystem in a throwaway container, then commit
+        # that with the desktop's own startup command restored
+        cleaner = await _run_docker(client.containers.run, config['snapshot_image'],
+                                    entrypoint=["sh", "-c", SNAPSHOT_CLEANUP_COMMAND], user="root",
+                                    detach=True, operation="start")
+        startup = _startup_config(desktop.attrs.get("Config"))
+        try:
+            await _run_docker(cleaner.wait, operation="build")
+            # Unset fields would be filled in from the cleaner, so empty ones are sent explicitly
+            image = await _run_docker(cleaner.commit, repository=repository, tag=tag, conf=startup,
+                                      operation="build")
+        finally:
+            await _run_docker(cleaner.remove, force=True, operation="stop")
+        
+        committed = _startup_config(image.attrs.get("Config"))
+        if committed != startup:
+            # A snapshot that would run something else than the desktop is worse than none
+            await _run_docker(client.images.remove, image.id, force=True, operation="stop")
+            return {"status": "error",
+                    "message": f"Snapshot would start with {committed} instead of {startup}, removed it"}
+        return {"status": "ok", "image_id": image.id, "snapshot_image": config['snapshot_image']}
+    except Exception as e:
+        logger.error(f"Container snapshot failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@service()
+async def reset_computer_container(use_snapshot=True, context=None):
+    """Replace the Computer Use container with a fresh one from the snapshot image.
+    Falls back to the base image when no snapshot has been taken yet.
+    
+    Args:
+        use_snapshot: False to start from the base image and remove the
+                      snapshot, e.g. when a desktop started from it did not come up
+    """
+    config = _get_config()
+    started = time.monotonic()
+    try:
+        client = await _get_docker()
+        image = config['snapshot_image']
+        source = "snapshot"
+        try:
+            if not use_snapshot:
+                await _run_docker(client.images.remove, image, force=True, operation="stop")
+                raise docker.errors.ImageNotFound("Snapshot removed")
+            await _run_docker(client.images.get, image)
+        except docker.errors.ImageNotFound:
+            image_result = await ensure_image_available(context)
+            if image_result["status"] != "ok":
+                return image_result
+            image = config['docker_image']
+            source = "image"
+        
+        # Throw away the dirty container, including its filesystem changes
+        existing = await _run_docker(client.containers.list, all=True, filters=_name_filter(config))
+        for container in existing:
+            await _run_docker(container.remove, force=True, operation="stop")
+        
+        container = await _run_docker(
+            client.containers.run,
+            image,
+            name=config['container_name'],
+            ports=config['ports'],
+            detach=True,
+            operation="start"
+        )
+        return {
+            "status": "ok",
+            "container_id": container.id,
+            "source": source,
+            "reset_ms": round((time.monotonic() - started) * 1000)
+        }
+    except Exception as e:
+        logger.error(f"Container reset failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
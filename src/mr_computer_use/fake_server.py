@@ -0,0 +1,194 @@
+"""Stand-in Computer Use API server for benchmarks and development without Docker.
+
+Implements the /computer-use/* endpoints used by ComputerClient with
+synthetic screenshots, plus injectable latency and failures.
+
+Run it on the default API port with:
+
+    python -m mr_computer_use.fake_server --port 3100 --width 1920 --height 1080 --latency-ms 20
+"""
+from aiohttp import web
+from io import BytesIO
+from PIL import Image, ImageDraw
+import argparse
+import asyncio
+import base64
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+class FakeComputerServer:
+    """Fake virtual desktop that records actions and draws them into its screenshots.
+
+    Args:
+        width: Screen width in pixels
+        height: Screen height in pixels
+        latency_ms: Delay added to every request
+        jitter_ms: Random extra delay of up to this much per request
+        failure_rate: Fraction of requests (0 to 1) answered with a 500 error
+        image_format: Format of the screenshots: "png" or "jpeg"
+        binary: Send raw image bodies to clients that accept them, instead of base64 JSON
+        clipboard: Serve the clipboard endpoint used to paste long text
+        type_ms_per_char: Time typing takes per character, like xdotool on a real desktop
+        seed: Seed for the random jitter and failures
+    """
+    def __init__(self, width=1280, height=800, latency_ms=0, jitter_ms=0, failure_rate=0.0,
+                 image_format="png", binary=True, clipboard=True, type_ms_per_char=0, seed=None):
+        self.width = width
+        self.height = height
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.image_format = image_format
+        self.binary = binary
+        self.type_ms_per_char = type_ms_per_char
+        self.random = random.Random(seed)
+        self.cursor = (width // 2, height // 2)
+        self.typed = ""
+        self.clipboard = ""
+        self.actions = 0
+        self.requests = 0
+        self._frame = None
+        self._runner = None
+
+        self.app = web.Application(middlewares=[self._inject_faults])
+        self.app.router.add_get("/computer-use/screenshot", self.screenshot)
+        self.app.router.add_get("/computer-use/screen-size", self.screen_size)
+        self.app.router.add_get("/computer-use/cursor-position", self.cursor_position)
+        self.app.router.add_post("/computer-use/mouse-move", self.mouse_move)
+        self.app.router.add_post("/computer-use/left-click", self.left_click)
+        self.app.router.add_post("/computer-use/right-click", self.action)
+        self.app.router.add_post("/computer-use/double-click", self.action)
+        self.app.router.add_post("/computer-use/type", self.type_text)
+        self.app.router.add_post("/computer-use/key", self.key)
+        if clipboard:
+            self.app.router.add_post("/computer-use/clipboard", self.set_clipboard)
+        self.app.router.add_post("/computer-use/scroll", self.action)
+        self.app.router.add_post("/computer-use/left-click-drag", self.drag)
+
+    @web.middleware
+    async def _inject_faults(self, request, handler):
+        """Add the configured latency and fail a share of requests"""
+        self.requests += 1
+        delay = self.latency_ms + self.random.uniform(0, self.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            return web.json_response({"status": "error", "message": "Injected failure"}, status=500)
+        return await handler(request)
+
+    def _changed(self):
+        """Record that an action changed what the screen shows"""
+        self.actions += 1
+        self._frame = None
+
+    def _render(self):
+        """Draw the current state and encode it, reusing the frame until the state changes"""
+        if self._frame is None:
+            img = Image.new("RGB", (self.width, self.height), (32, 64, 96))
+            draw = ImageDraw.Draw(img)
+            draw.rectangle((0, 0, self.width, 40), fill=(200, 200, 200))
+            draw.text((10, 12), f"actions: {self.actions}", fill=(0, 0, 0))
+            draw.text((10, 60), self.typed[-200:], fill=(255, 255, 255))
+            x, y = self.cursor
+            draw.ellipse((x - 5, y - 5, x + 5, y + 5), fill=(255, 0, 0))
+            buffer = BytesIO()
+            if self.image_format == "jpeg":
+                img.save(buffer, format="JPEG", quality=85)
+            else:
+                img.save(buffer, format="PNG")
+            self._frame = buffer.getvalue()
+        return self._frame
+
+    async def screenshot(self, request):
+        if self.binary and "image/" in request.headers.get("Accept", ""):
+            return web.Response(body=self._render(), content_type=f"image/{self.image_format}")
+        data = base64.b64encode(self._render()).decode()
+        return web.json_response({"image": f"data:image/{self.image_format};base64,{data}"})
+
+    async def screen_size(self, request):
+        return web.json_response({"status": "ok", "width": self.width, "height": self.height})
+
+    async def cursor_position(self, request):
+        return web.json_response({"status": "ok", "x": self.cursor[0], "y": self.cursor[1]})
+
+    async def mouse_move(self, request):
+        payload = await request.json()
+        self.cursor = (int(payload["x"]), int(payload["y"]))
+        self._changed()
+        return web.json_response({"status": "ok"})
+
+    async def action(self, request):
+        self._changed()
+        return web.json_response({"status": "ok"})
+
+    async def left_click(self, request):
+        # Clicks may carry the position to move to first
+        if request.can_read_body:
+            payload = await request.json()
+            self.cursor = (int(payload["x"]), int(payload["y"]))
+        self._changed()
+        return web.json_response({"status": "ok"})
+
+    async def type_text(self, request):
+        payload = await request.json()
+        if self.type_ms_per_char:
+            await asyncio.sleep(len(payload["text"]) * self.type_ms_per_char / 1000)
+        self.typed += payload["text"]
+        self._changed()
+        return web.json_response({"status": "ok"})
+
+    async def key(self, request):
+        payload = await request.json()
+        # Pasting types whatever is on the clipboard
+        self.typed += self.clipboard * payload["key"].split(" ").count("ctrl+v")
+        self._changed()
+        return web.json_response({"status": "ok"})
+
+    async def set_clipboard(self, request):
+        payload = await request.json()
+        self.clipboard = payload["text"]
+        return web.json_response({"status": "ok"})
+
+    async def drag(self, request):
+        payload = await request.json()
+        self.cursor = (int(payload["endX"]), int(payload["endY"]))
+        self._changed()
+        return web.json_response({"status": "ok"})
+
+    async def start(self, host="localhost", port=3100):
+        """Start serving in the running event loop"""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        """Stop serving"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Computer Use API server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--image-format", choices=["png", "jpeg"], default="png")
+    parser.add_argument("--json-only", action="store_true", help="Only send screenshots as base64 JSON")
+    parser.add_argument("--no-clipboard", action="store_true", help="Leave out the clipboard endpoint")
+    parser.add_argument("--type-ms-per-char", type=float, default=0)
+    args = parser.parse_args()
+
+    server = FakeComputerServer(args.width, args.height, args.latency_ms, args.jitter_ms,
+                                args.failure_rate, args.image_format, not args.json_only,
+                                not args.no_clipboard, args.type_ms_per_char)
+    web.run_app(server.app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
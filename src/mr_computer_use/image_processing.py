@@ -0,0 +1,329 @@
+from io import BytesIO
+from PIL import Image, ImageChops
+import numpy as np
+from collections import OrderedDict
+import base64
+import hashlib
+import logging
+from .docker_control import _get_config, DEFAULT_SCREENSHOT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails of chat images by hash of their base64 data, least recently used first
+_thumbnail_cache = OrderedDict()
+
+# Output formats supported by the encoding stage, mapped to PIL format names
+IMAGE_FORMATS = {
+    "png": "PNG",
+    "jpeg": "JPEG",
+    "jpg": "JPEG",
+    "webp": "WEBP",
+}
+
+# Max number of chat image thumbnails kept so they aren't recomputed every turn
+THUMBNAIL_CACHE_SIZE = 256
+
+# Largest factor computer_screenshot_region enlarges a region by
+MAX_REGION_ZOOM = 4.0
+
+# Frames are compared on small grayscale thumbnails of at most this size
+FRAME_THUMBNAIL_SIZE = (256, 256)
+
+# Per-pixel brightness difference below which a thumbnail pixel counts as unchanged
+FRAME_PIXEL_TOLERANCE = 8
+
+def get_screenshot_settings(context=None):
+    """Get the screenshot encoding settings for the current agent.
+    
+    Global settings from the "screenshot" config section are merged over
+    the defaults, then any overrides for the agent in "agents" are applied.
+    """
+    config = _get_config()
+    settings = {**DEFAULT_SCREENSHOT_CONFIG, **config.get("screenshot", {})}
+    agent_name = getattr(context, "agent_name", None)
+    if agent_name:
+        agent_config = config.get("agents", {}).get(agent_name, {})
+        settings.update(agent_config.get("screenshot", {}))
+    return settings
+
+def _scale_factor(width, height, settings):
+    """Get the downscale factor needed to fit within the max dimensions"""
+    scale = 1.0
+    if settings.get("max_width"):
+        scale = min(scale, settings["max_width"] / width)
+    if settings.get("max_height"):
+        scale = min(scale, settings["max_height"] / height)
+    return scale
+
+def scaled_size(width, height, settings):
+    """Get the size a screen of the given size is sent to the model at"""
+    scale = _scale_factor(width, height, settings)
+    if scale >= 1.0:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+class ScreenTransform:
+    """Maps coordinates between the screenshots an agent is sent and the native screen.
+    
+    Agents can have different screenshot sizes for the same desktop, so a
+    transform is built for each call rather than kept on the shared client.
+    """
+    def __init__(self, scale_x=1.0, scale_y=1.0):
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+
+    @classmethod
+    def for_screen(cls, width, height, settings):
+        """Build the transform for a native screen size and an agent's screenshot settings"""
+        scaled_width, scaled_height = scaled_size(width, height, settings)
+        return cls(width / scaled_width, height / scaled_height)
+
+    def to_screen(self, x, y):
+        """Convert a point from screenshot coordinates to native screen coordinates"""
+        return round(float(x) * self.scale_x), round(float(y) * self.scale_y)
+
+    def from_screen(self, x, y):
+        """Convert a point from native screen coordinates to screenshot coordinates"""
+        return round(float(x) / self.scale_x), round(float(y) / self.scale_y)
+
+# Transform for coordinates already in native screen space
+NATIVE_TRANSFORM = ScreenTransform()
+
+class Screenshot:
+    """An encoded screenshot that is only decoded to pixels when something needs them.
+    
+    Keeps the bytes exactly as they are sent to the model, with their size,
+    format and hash, so frames can be delivered and compared without a PIL
+    decode and re-encode.
+    """
+    def __init__(self, data, fmt, width, height, image=None):
+        self.data = data
+        self.format = fmt
+        self.width = width
+        self.height = height
+        self._image = image
+        self._digest = None
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def media_type(self):
+        return f"image/{self.format.lower()}"
+
+    @property
+    def digest(self):
+        """Hash of the encoded bytes, computed on first use"""
+        if self._digest is None:
+            self._digest = hashlib.blake2b(self.data, digest_size=16).hexdigest()
+        return self._digest
+
+    @property
+    def image(self):
+        """PIL image backed by the encoded bytes. PIL decodes the pixels on first access to them."""
+        if self._image is None:
+            self._image = Image.open(BytesIO(self.data))
+        return self._image
+
+    def detached(self):
+        """Get a copy holding only the encoded bytes, without any decoded pixels"""
+        copy = Screenshot(self.data, self.format, self.width, self.height)
+        copy._digest = self._digest
+        return copy
+
+    def to_base64(self):
+        """Get the encoded bytes as base64 text"""
+        return base64.b64encode(self.data).decode("ascii")
+
+    def to_image_part(self):
+        """Get a chat message content part carrying the encoded bytes as they are"""
+        return {"type": "image_url", "image_url": {"url": f"data:{self.media_type};base64,{self.to_base64()}"}}
+
+def encode_screenshot(img_data, settings=None):
+    """Encode raw screenshot bytes according to the screenshot settings.
+    
+    Args:
+        img_data: The encoded image bytes received from the VM
+        settings: Dict of screenshot settings (see DEFAULT_SCREENSHOT_CONFIG)
+        
+    Returns:
+        Tuple of (Screenshot holding the encoded bytes, info dict with the
+        original and output dimensions, output format and byte size)
+    """
+    settings = {**DEFAULT_SCREENSHOT_CONFIG, **(settings or {})}
+    fmt = IMAGE_FORMATS.get(str(settings["format"]).lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported screenshot format: {settings['format']}")
+    
+    # Only reads the header, the pixels are not decoded yet
+    img = Image.open(BytesIO(img_data))
+    original_width, original_height = img.size
+    scale = _scale_factor(original_width, original_height, settings)
+    
+    # Nothing to change, so hand back the original bytes without decoding them
+    if scale >= 1.0 and not settings["grayscale"] and img.format == fmt:
+        info = {
+            "original_width": original_width,
+            "original_height": original_height,
+            "width": original_width,
+            "height": original_height,
+            "format": fmt.lower(),
+            "bytes": len(img_data)
+        }
+        return Screenshot(bytes(img_data), fmt, original_width, original_height, img), info
+    
+    if settings["grayscale"]:
+        img = img.convert("L")
+    if scale < 1.0:
+        img = img.resize(scaled_size(original_width, original_height, settings), Image.LANCZOS)
+    
+    screenshot = _encode_image(img, fmt, settings)
+    info = {
+        "original_width": original_width,
+        "original_height": original_height,
+        "width": screenshot.width,
+        "height": screenshot.height,
+        "format": fmt.lower(),
+        "bytes": len(screenshot.data)
+    }
+    return screenshot, info
+
+def _encode_image(img, fmt, settings):
+    """Encode a PIL image in the given format with the quality from the settings"""
+    save_args = {}
+    if fmt == "JPEG":
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        save_args = {"quality": settings["quality"], "optimize": True}
+    elif fmt == "WEBP":
+        save_args = {"quality": settings["quality"]}
+    
+    buffer = BytesIO()
+    img.save(buffer, format=fmt, **save_args)
+    return Screenshot(buffer.getvalue(), fmt, img.size[0], img.size[1])
+
+def crop_screenshot(screenshot, box, zoom=1.0, settings=None):
+    """Cut a region out of a native resolution screenshot and encode it.
+    
+    Args:
+        screenshot: Screenshot at the native screen resolution
+        box: (left, top, right, bottom) of the region in native pixels
+        zoom: Factor to enlarge the region by, up to MAX_REGION_ZOOM
+        settings: Dict of screenshot settings. The format, quality and
+                  grayscale settings apply, and the max dimensions cap the
+                  zoomed size.
+        
+    Returns:
+        Tuple of (Screenshot of the region, info dict with the output
+        dimensions, format and byte size)
+    """
+    settings = {**DEFAULT_SCREENSHOT_CONFIG, **(settings or {})}
+    fmt = IMAGE_FORMATS.get(str(settings["format"]).lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported screenshot format: {settings['format']}")
+    
+    img = screenshot.image.crop(box)
+    if settings["grayscale"]:
+        img = img.convert("L")
+    zoom = min(max(float(zoom), 1.0), MAX_REGION_ZOOM)
+    width, height = img.size
+    # Enlarge, but never past the configured max dimensions
+    zoom = max(1.0, min(zoom, _scale_factor(width * zoom, height * zoom, settings) * zoom))
+    if zoom > 1.0:
+        img = img.resize((round(width * zoom), round(height * zoom)), Image.LANCZOS)
+    
+    region = _encode_image(img, fmt, settings)
+    info = {
+        "width": region.width,
+        "height": region.height,
+        "format": fmt.lower(),
+        "bytes": len(region.data)
+    }
+    return region, info
+
+def frame_thumbnail(screenshot):
+    """Get a small grayscale thumbnail of a frame for approximate comparisons"""
+    thumbnail = screenshot.image.convert("L")
+    thumbnail.thumbnail(FRAME_THUMBNAIL_SIZE)
+    return thumbnail
+
+def frame_difference(thumbnail_a, thumbnail_b):
+    """Get the fraction of pixels that differ noticeably between two frame thumbnails"""
+    if thumbnail_a.size != thumbnail_b.size:
+        return 1.0
+    histogram = ImageChops.difference(thumbnail_a, thumbnail_b).histogram()
+    changed = sum(histogram[FRAME_PIXEL_TOLERANCE + 1:])
+    return changed / (thumbnail_a.size[0] * thumbnail_a.size[1])
+
+def frame_array(screenshot, region=None):
+    """Get a frame as a grayscale NumPy array, optionally cropped to a region.
+    
+    Args:
+        screenshot: The frame
+        region: Optional dict with x, y, width and height in frame pixels
+    """
+    img = screenshot.image
+    if region:
+        x, y = int(region["x"]), int(region["y"])
+        img = img.crop((x, y, x + int(region["width"]), y + int(region["height"])))
+    return np.asarray(img.convert("L"), dtype=np.int16)
+
+def changed_fraction(array_a, array_b, tolerance=FRAME_PIXEL_TOLERANCE):
+    """Get the fraction of pixels whose brightness differs by more than the tolerance"""
+    if array_a.shape != array_b.shape or array_a.size == 0:
+        return 1.0
+    changed = np.count_nonzero(np.abs(array_a - array_b) > tolerance)
+    return float(changed) / array_a.size
+
+def diff_frames(screenshot_a, screenshot_b, tolerance=FRAME_PIXEL_TOLERANCE):
+    """Compare two frames pixel by pixel.
+    
+    Returns:
+        Dict with the fraction of changed pixels and the bounding box of the
+        changes as x, y, width and height (None if nothing changed). Frames
+        of different sizes count as entirely changed.
+    """
+    if screenshot_a.digest == screenshot_b.digest:
+        return {"difference": 0.0, "changed_box": None}
+    if screenshot_a.size != screenshot_b.size:
+        return {"difference": 1.0,
+                "changed_box": {"x": 0, "y": 0, "width": screenshot_b.width, "height": screenshot_b.height}}
+    changed = np.abs(frame_array(screenshot_a) - frame_array(screenshot_b)) > tolerance
+    if not changed.any():
+        return {"difference": 0.0, "changed_box": None}
+    rows = np.flatnonzero(changed.any(axis=1))
+    columns = np.flatnonzero(changed.any(axis=0))
+    return {
+        "difference": float(changed.sum()) / changed.size,
+        "changed_box": {"x": int(columns[0]), "y": int(rows[0]),
+                        "width": int(columns[-1] - columns[0] + 1), "height": int(rows[-1] - rows[0] + 1)}
+    }
+
+def thumbnail_base64(data, size=256, quality=60):
+    """Shrink a base64 encoded image to a JPEG thumbnail.
+    
+    Args:
+        data: The image as base64 text
+        size: Max width and height of the thumbnail
+        quality: JPEG quality of the thumbnail
+        
+    Returns:
+        Tuple of (media type, thumbnail as base64 text)
+    """
+    key = (hashlib.blake2b(data.encode("ascii"), digest_size=16).digest(), size, quality)
+    cached = _thumbnail_cache.get(key)
+    if cached is not None:
+        _thumbnail_cache.move_to_end(key)
+        return cached
+    img = Image.open(BytesIO(base64.b64decode(data)))
+    # Lets JPEG images decode straight at a reduced size
+    img.draft("RGB", (size, size))
+    img = img.convert("RGB")
+    img.thumbnail((size, size))
+    thumbnail = _encode_image(img, "JPEG", {"quality": quality})
+    result = (thumbnail.media_type, thumbnail.to_base64())
+    _thumbnail_cache[key] = result
+    while len(_thumbnail_cache) > THUMBNAIL_CACHE_SIZE:
+        _thumbnail_cache.popitem(last=False)
+    return result
@@ -0,0 +1,126 @@
+"""Key names, chords and sequences for computer_press_key, in xdotool form.
+
+A key spec is a list of chords separated by spaces or commas. A chord is
+keys joined with "+", modifiers first, and may end in "*N" to press it N
+times:
+
+    enter
+    ctrl+shift+t
+    tab*3 enter
+    ctrl+a, ctrl+c
+"""
+from functools import lru_cache
+import re
+from .keysyms import KEYSYMS
+
+# Common key names mapped to xdotool key names
+KEY_MAP = {
+    # Common name conversions
+    "enter": "Return",
+    "return": "Return",
+    "esc": "Escape",
+    "escape": "Escape",
+    "tab": "Tab",
+    "space": "space",
+    "backspace": "BackSpace",
+    "delete": "Delete",
+    "del": "Delete",
+    # Arrow keys
+    "up": "Up", "down": "Down", "left": "Left", "right": "Right",
+    # Other special keys
+    "home": "Home", "end": "End", "pageup": "Page_Up", "pagedown": "Page_Down",
+    "insert": "Insert", "printscreen": "Print", "menu": "Menu",
+    "capslock": "Caps_Lock",
+    # Characters that are hard to write inside a spec
+    "plus": "plus", "minus": "minus", "comma": "comma", "asterisk": "asterisk",
+    **{f"f{number}": f"F{number}" for number in range(1, 13)},
+}
+
+# Modifier names mapped to xdotool modifiers
+MODIFIERS = {
+    "ctrl": "ctrl", "control": "ctrl",
+    "alt": "alt", "option": "alt",
+    "shift": "shift",
+    "super": "super", "win": "super", "meta": "super", "cmd": "super",
+}
+
+# Most times a single chord may be repeated, and most chords in one spec
+MAX_KEY_REPEAT = 50
+MAX_KEY_SEQUENCE = 100
+
+_SEPARATOR = re.compile(r"[\s,]+")
+_REPEAT = re.compile(r"^(.+)\*(\d+)$")
+
+class KeySpecError(ValueError):
+    pass
+
+def map_key_to_xdotool(key):
+    """
+    Maps common key names to their xdotool equivalents.
+    This ensures consistent handling of special keys across the codebase.
+
+    Args:
+        key: The key name to map
+
+    Returns:
+        The xdotool key name
+    """
+    # Return the mapped key or the original if not in the map (case-insensitive check)
+    return KEY_MAP.get(key.lower(), key)
+
+def _parse_key(name):
+    """Map one key of a chord to its xdotool name"""
+    lowered = name.lower()
+    if lowered in KEY_MAP:
+        return KEY_MAP[lowered]
+    if lowered in MODIFIERS:
+        return MODIFIERS[lowered]
+    # Other names are passed through if they are X keysyms, e.g. period, KP_Enter or XF86AudioMute
+    if len(name) == 1 or name in KEYSYMS:
+        return name
+    raise KeySpecError(f"Unknown key: {name}")
+
+def _parse_chord(chord):
+    """Map a chord such as ctrl+shift+t to xdotool form"""
+    # A lone "+" is the plus key rather than an empty chord
+    names = ["plus"] if chord == "+" else chord.split("+")
+    if "" in names:
+        raise KeySpecError(f"Invalid key chord: {chord} (use 'plus' for the + key)")
+    for name in names[:-1]:
+        if name.lower() not in MODIFIERS:
+            raise KeySpecError(f"Only modifiers can come before the last key in {chord}: {name}")
+    return "+".join(_parse_key(name) for name in names)
+
+@lru_cache(maxsize=256)
+def _parse_keys(spec):
+    chords = []
+    for token in _SEPARATOR.split(spec.strip()):
+        if not token:
+            continue
+        count = 1
+        repeat = _REPEAT.match(token)
+        if repeat:
+            token, count = repeat.group(1), int(repeat.group(2))
+            if not 1 <= count <= MAX_KEY_REPEAT:
+                raise KeySpecError(f"Repeat count must be between 1 and {MAX_KEY_REPEAT}: {token}*{count}")
+        chords.extend([_parse_chord(token)] * count)
+        if len(chords) > MAX_KEY_SEQUENCE:
+            raise KeySpecError(f"Too many keys in one sequence (max {MAX_KEY_SEQUENCE})")
+    if not chords:
+        raise KeySpecError("No keys given")
+    return tuple(chords)
+
+def parse_keys(spec):
+    """Parse a key spec into xdotool chords, one per key press.
+    Specs are parsed once and cached, as agents repeat the same few.
+
+    Args:
+        spec: Key spec such as "ctrl+shift+t" or "tab*3 enter"
+
+    Returns:
+        List of xdotool chords, e.g. ["Tab", "Tab", "Tab", "Return"]
+
+    Raises:
+        KeySpecError: If the spec has unknown keys or is malformed
+    """
+    return list(_parse_keys(str(spec)))
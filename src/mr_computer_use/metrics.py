@@ -0,0 +1,164 @@
+import functools
+import logging
+import time
+from .docker_control import _get_config, DEFAULT_METRICS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets for durations in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Histogram buckets for payload sizes in bytes
+SIZE_BUCKETS = (10000, 50000, 100000, 250000, 500000, 1000000, 2500000, 5000000)
+
+def _format_labels(labels):
+    """Format label pairs in Prometheus text syntax"""
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+class Counter:
+    """Monotonic counter with one value per label combination"""
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Gauge:
+    """Value that can go up and down, one per label combination"""
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+
+    def set(self, value, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+    """Histogram with cumulative buckets, one set per label combination"""
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry["counts"][index] += 1
+        entry["sum"] += value
+        entry["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, entry in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, entry["counts"]):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {entry['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {entry['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {entry['count']}")
+        return lines
+
+COMMAND_SECONDS = Histogram("mr_computer_use_command_seconds",
+                            "Time taken by computer use commands", LATENCY_BUCKETS)
+COMMAND_ERRORS = Counter("mr_computer_use_command_errors_total",
+                         "Computer use commands that returned an error")
+HTTP_SECONDS = Histogram("mr_computer_use_http_request_seconds",
+                         "Time taken by Computer Use API requests", LATENCY_BUCKETS)
+HTTP_ERRORS = Counter("mr_computer_use_http_errors_total",
+                      "Computer Use API requests that failed or returned an error status")
+HTTP_RETRIES = Counter("mr_computer_use_http_retries_total",
+                       "Computer Use API requests repeated after a failure")
+SCREENSHOT_CAPTURE_SECONDS = Histogram("mr_computer_use_screenshot_capture_seconds",
+                                       "Time taken to download a screenshot", LATENCY_BUCKETS)
+SCREENSHOT_DECODE_SECONDS = Histogram("mr_computer_use_screenshot_decode_seconds",
+                                      "Time taken to unpack a downloaded screenshot", LATENCY_BUCKETS)
+SCREENSHOT_ENCODE_SECONDS = Histogram("mr_computer_use_screenshot_encode_seconds",
+                                      "Time taken to resize and encode a screenshot", LATENCY_BUCKETS)
+SCREENSHOT_SHARED = Counter("mr_computer_use_screenshot_shared_total",
+                            "Screenshot requests served by a capture already in flight or just taken")
+SCREENSHOT_BYTES = Histogram("mr_computer_use_screenshot_bytes",
+                             "Size of screenshots sent to the model", SIZE_BUCKETS)
+ACTION_QUEUE_DEPTH = Gauge("mr_computer_use_action_queue_depth",
+                           "Actions waiting for earlier actions on the same container")
+ACTION_QUEUE_WAIT_SECONDS = Histogram("mr_computer_use_action_queue_wait_seconds",
+                                      "Time actions waited in the queue before running", LATENCY_BUCKETS)
+ACTIONS_MERGED = Counter("mr_computer_use_actions_merged_total",
+                         "Queued actions replaced by a later one before they were sent")
+
+METRICS = [
+    COMMAND_SECONDS, COMMAND_ERRORS,
+    HTTP_SECONDS, HTTP_ERRORS, HTTP_RETRIES,
+    SCREENSHOT_CAPTURE_SECONDS, SCREENSHOT_DECODE_SECONDS, SCREENSHOT_ENCODE_SECONDS, SCREENSHOT_BYTES,
+    SCREENSHOT_SHARED,
+    ACTION_QUEUE_DEPTH, ACTION_QUEUE_WAIT_SECONDS, ACTIONS_MERGED,
+]
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def forget_container(container):
+    """Drop every series labelled with a container.
+    Pool containers get a new API URL each time, so their series are
+    dropped when they are destroyed instead of piling up.
+    """
+    for metric in METRICS:
+        for key in [key for key in metric.values if ("container", container) in key]:
+            del metric.values[key]
+
+def log_if_slow(kind, name, container, seconds):
+    """Log a call that took longer than the configured slow_call_ms"""
+    config = {**DEFAULT_METRICS_CONFIG, **_get_config().get("metrics", {})}
+    slow_call_ms = config["slow_call_ms"]
+    if slow_call_ms and seconds * 1000 >= slow_call_ms:
+        logger.warning(f"Slow {kind} {name} on {container}: {round(seconds * 1000)}ms")
+
+def timed_command(func):
+    """Record the latency and errors of a command, labelled by command and container"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        # Imported here as computer_client records its own metrics through this module
+        from .computer_client import get_api_url
+        container = get_api_url(kwargs.get("context"))
+        started = time.perf_counter()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            COMMAND_ERRORS.inc(command=func.__name__, container=container)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            COMMAND_SECONDS.observe(elapsed, command=func.__name__, container=container)
+            log_if_slow("command", func.__name__, container, elapsed)
+        if isinstance(result, dict) and result.get("status") == "error":
+            COMMAND_ERRORS.inc(command=func.__name__, container=container)
+        return result
+    return wrapper
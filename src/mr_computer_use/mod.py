@@ -1,14 +1,200 @@
 from lib.providers.commands import command
 from lib.pipelines.pipe import pipe
+from lib.providers.hooks import hook
 import docker
 import asyncio
+import functools
+import inspect
 import logging
+import time
 from .docker_control import check_docker, build_computer_image, ensure_image_available, start_computer_container, stop_computer_container
-from .computer_client import get_computer_client
+from .docker_control import snapshot_computer_container, reset_computer_container
+from .docker_control import _get_config, DEFAULT_READINESS_CONFIG, DEFAULT_CONTEXT_CONFIG
+from .computer_client import get_computer_client, close_computer_client, close_computer_clients, invalidate_screen_sizes, session_released
+from .image_processing import get_screenshot_settings, scaled_size, ScreenTransform, NATIVE_TRANSFORM, crop_screenshot, diff_frames, thumbnail_base64
+from .screenshot_history import get_history, record_frame, clear_history
+from .container_status import stop_status_watcher
+from .metrics import timed_command
+from .container_pool import is_pool_enabled, acquire_computer_container, release_computer_container, shutdown_computer_pool
 
 logger = logging.getLogger(__name__)
 
+# Background post-action captures of each session that have not finished yet
+_pending_captures = {}
+
+def requires_session_container(func):
+    """Fail a desktop command if the session's pool container was released for being idle.
+    Otherwise the command would quietly run on the shared container instead.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if session_released(getattr(kwargs.get("context"), "log_id", None)):
+            return {"status": "error",
+                    "message": "This session's desktop was released after being idle. "
+                               "Run computer_start to get a new one."}
+        return await func(*args, **kwargs)
+    return wrapper
+
+async def _capture_screenshot(client, context=None):
+    """Capture a screenshot encoded with the current agent's screenshot settings"""
+    return await client.get_screenshot(get_screenshot_settings(context))
+
+def _record_history(screenshot, context=None):
+    """Add a screenshot delivered to the session to its history"""
+    record_frame(getattr(context, "log_id", None), screenshot, getattr(context, "username", None))
+
+def _remember_frame(client, screenshot, context=None):
+    """Record a screenshot as the last one delivered to the session, and as a step in its history"""
+    threshold = get_screenshot_settings(context)["unchanged_threshold"]
+    client.remember_frame(getattr(context, "log_id", None), screenshot, threshold)
+    _record_history(screenshot, context)
+
+async def _add_image_to_chat(screenshot, context=None):
+    """Insert a screenshot into the chat exactly as it was encoded, and return the message added.
+    Contexts without a chat log fall back to format_image_message, which re-encodes the image.
+    """
+    message = {"role": "user", "content": [screenshot.to_image_part()]}
+    chat_log = getattr(context, "chat_log", None)
+    if chat_log is not None:
+        added = chat_log.add_message(message)
+        if inspect.isawaitable(added):
+            await added
+    else:
+        await context.format_image_message(screenshot.image)
+    return message
+
+def _apply_screenshot_scale(screen_size, context=None):
+    """Convert a screen size result to the size screenshots are sent at"""
+    if not screen_size or screen_size.get("status") != "ok":
+        return
+    width, height = screen_size.get("width"), screen_size.get("height")
+    if not isinstance(width, int) or not isinstance(height, int):
+        return
+    scaled_width, scaled_height = scaled_size(width, height, get_screenshot_settings(context))
+    if (scaled_width, scaled_height) != (width, height):
+        screen_size["width"], screen_size["height"] = scaled_width, scaled_height
+        screen_size["native_width"], screen_size["native_height"] = width, height
+
+async def _get_screen_transform(client, context=None):
+    """Get the mapping between the current agent's screenshots and the native screen.
+    Agents sharing a desktop can have different screenshot sizes, so it is
+    worked out for each call from the cached screen size.
+    """
+    screen_size = await client.get_screen_size()
+    width, height = screen_size.get("width"), screen_size.get("height")
+    if screen_size.get("status") != "ok" or not isinstance(width, int) or not isinstance(height, int):
+        return NATIVE_TRANSFORM
+    return ScreenTransform.for_screen(width, height, get_screenshot_settings(context))
+
+async def _get_action_client(context=None):
+    """Get the session's client for an action, first cancelling any capture still pending from an earlier action"""
+    task = _pending_captures.pop(getattr(context, "log_id", None), None)
+    if task is not None and not task.done():
+        task.cancel()
+    return await get_computer_client(context)
+
+async def _post_action_screenshot(client, result, action, context=None):
+    """Add a screenshot to the chat after an action, noting its size in the result.
+    If the screen looks the same as the last frame delivered to this session,
+    the result just says so instead of adding another image. With
+    async_capture on, the capture runs in the background and the screenshot
+    is added to the chat once it is ready.
+    """
+    settings = get_screenshot_settings(context)
+    if not settings["async_capture"]:
+        screenshot, unchanged = await _capture_action_screenshot(client, action, settings, context)
+        if isinstance(result, dict):
+            if unchanged:
+                result["screenshot"] = "screen unchanged"
+            elif screenshot:
+                result["screenshot_bytes"] = len(screenshot.data)
+        if screenshot and not unchanged:
+            try:
+                await _add_image_to_chat(screenshot, context)
+            except Exception as e:
+                logger.error(f"Post-{action} screenshot error: {str(e)}")
+        return
+    
+    session_id = getattr(context, "log_id", None)
+    _pending_captures[session_id] = asyncio.create_task(
+        _deliver_action_screenshot(client, action, settings, context, settings["capture_delay_ms"] / 1000))
+    if isinstance(result, dict):
+        result["screenshot"] = "pending"
+
+async def _deliver_action_screenshot(client, action, settings, context=None, delay=0):
+    """Capture the screen in the background after an action and add the screenshot to the chat.
+    Returns the message added, or None if nothing was added.
+    """
+    screenshot, unchanged = await _capture_action_screenshot(client, action, settings, context, delay)
+    if not screenshot or unchanged:
+        return None
+    try:
+        return await _add_image_to_chat(screenshot, context)
+    except Exception as e:
+        logger.error(f"Post-{action} screenshot error: {str(e)}")
+        return None
+
+async def _capture_action_screenshot(client, action, settings, context=None, delay=0):
+    """Capture the screen after an action.
+    
+    Returns:
+        The screenshot, or None if capture failed, and whether it looks the
+        same as the last frame delivered to the session
+    """
+    try:
+        if delay:
+            await asyncio.sleep(delay)
+        if settings["settle_ms"]:
+            # Let animations and page loads finish before capturing
+            screenshot, _ = await client.wait_until_idle(stable_time=settings["settle_ms"] / 1000,
+                                                         timeout=settings["settle_timeout_ms"] / 1000,
+                                                         settings=settings)
+        else:
+            screenshot = await client.get_screenshot(settings)
+        if not screenshot:
+            return None, False
+        if settings["skip_unchanged"]:
+            session_id = getattr(context, "log_id", None)
+            unchanged = client.is_frame_unchanged(session_id, screenshot, settings["unchanged_threshold"])
+            # An unchanged screen is still a step in the history
+            _record_history(screenshot, context)
+            return screenshot, unchanged
+        # Still the session's latest frame, and a step in its history
+        _remember_frame(client, screenshot, context)
+        return screenshot, False
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Post-{action} screenshot error: {str(e)}")
+        return None, False  # Don't fail the command if screenshot fails
+
+async def _wait_for_desktop(result, context=None):
+    """Wait for a started desktop to answer, then add a screenshot to the chat"""
+    client = await get_computer_client(context)
+    readiness = {**DEFAULT_READINESS_CONFIG, **_get_config().get("readiness", {})}
+    ready = await client.wait_until_ready(**readiness)
+    if ready["status"] != "ok":
+        result["status"] = "error"
+        result["message"] = ready["message"]
+        return
+    result["startup_ms"] = ready["startup_ms"]
+    try:
+        screenshot = await _capture_screenshot(client, context)
+        if screenshot:
+            _remember_frame(client, screenshot, context)
+            # Insert the screenshot into the chat
+            image_message = await _add_image_to_chat(screenshot, context)
+            result["screenshot"] = "added to chat"
+            result["screenshot_bytes"] = len(screenshot.data)
+            result["image_message"] = image_message["content"][0]
+        else:
+            result["screenshot"] = "failed to capture"
+    except Exception as e:
+        logger.error(f"Screenshot error: {str(e)}")
+        result["screenshot_error"] = str(e)
+
 @command()
+@timed_command
 async def computer_check_docker(context=None):
     """Check if Docker is installed and running.
     
@@ -19,10 +205,13 @@ async def computer_check_docker(context=None):
     return result
 
 @command()
+@timed_command
 async def computer_start(context=None):
     """Start the computer use virtual desktop container.
     If the container doesn't exist, it will be created.
     If the image doesn't exist, it will be pulled from Docker Hub or built.
+    When the container pool is enabled, this session gets its own
+    pre-started container instead.
     
     Example:
     { "computer_start": {} }
@@ -32,41 +221,86 @@ async def computer_start(context=None):
     if docker_check["status"] != "ok":
         return docker_check
     
-    # Start container
-    result = await start_computer_container(context)
+    # Start container, or take one from the pool for this session
+    if is_pool_enabled():
+        result = await acquire_computer_container(context)
+    else:
+        result = await start_computer_container(context)
+    # The desktop may come back at a different resolution
+    invalidate_screen_sizes()
     
-    # If started successfully, wait a moment and get a screenshot
+    # If started successfully, wait for the desktop to answer and get a screenshot
     if result["status"] == "ok":
-        client = await get_computer_client(context)
-        try:
-            # Wait a moment for the desktop to initialize
-            await asyncio.sleep(5)  
-            
-            screenshot = await client.get_screenshot()
-            if screenshot:
-                # Insert the screenshot into the chat
-                image_message = await context.format_image_message(screenshot)
-                result["screenshot"] = "added to chat"
-                result["image_message"] = image_message
-            else:
-                result["screenshot"] = "failed to capture"
-        except Exception as e:
-            logger.error(f"Screenshot error: {str(e)}")
-            result["screenshot_error"] = str(e)
+        await _wait_for_desktop(result, context)
+        # Keep the freshly booted desktop as the known-good state for computer_reset
+        if result["status"] == "ok" and result.get("created") and _get_config()["snapshot_on_first_boot"]:
+            snapshot = await snapshot_computer_container(context)
+            result["snapshot"] = snapshot["status"]
     
     return result
 
 @command()
+@timed_command
+async def computer_reset(context=None):
+    """Reset the virtual desktop to a clean state, discarding everything done since it first booted.
+    The container is replaced with a fresh one from the snapshot taken after
+    its first boot. When the container pool is enabled, this session gets a
+    fresh container from the pool instead.
+    
+    Example:
+    { "computer_reset": {} }
+    """
+    started = time.monotonic()
+    # Frames of the discarded desktop must not be compared with the clean one
+    clear_history(getattr(context, "log_id", None))
+    if is_pool_enabled():
+        await release_computer_container(context)
+        result = await acquire_computer_container(context)
+    else:
+        result = await reset_computer_container(context)
+        # Pooled connections to the old container are dead; other sessions' pool containers are untouched
+        await close_computer_client(_get_config()['api_url'])
+    invalidate_screen_sizes()
+    
+    if result["status"] == "ok":
+        await _wait_for_desktop(result, context)
+        if result.get("source") == "snapshot" and result.get("screenshot") != "added to chat":
+            # A snapshot that cannot bring the desktop back is replaced by a fresh boot of the base image
+            problem = result.get("message") or result.get("screenshot_error") or "no screenshot"
+            logger.warning(f"Desktop reset from snapshot failed ({problem}), resetting from the base image")
+            result = await reset_computer_container(use_snapshot=False, context=context)
+            await close_computer_client(_get_config()['api_url'])
+            invalidate_screen_sizes()
+            if result["status"] == "ok":
+                result["snapshot_failed"] = problem
+                await _wait_for_desktop(result, context)
+                if result["status"] == "ok" and _get_config()["snapshot_on_first_boot"]:
+                    snapshot = await snapshot_computer_container(context)
+                    result["snapshot"] = snapshot["status"]
+        result["reset_ms"] = round((time.monotonic() - started) * 1000)
+    return result
+
+@command()
+@timed_command
 async def computer_stop(context=None):
     """Stop the computer use virtual desktop container.
+    When the container pool is enabled, this session's container is
+    returned to the pool instead.
     
     Example:
     { "computer_stop": {} }
     """
+    if is_pool_enabled():
+        return await release_computer_container(context)
+    
     result = await stop_computer_container(context)
+    # Drop pooled connections to the stopped desktop
+    await close_computer_client(_get_config()['api_url'])
     return result
 
 @command()
+@timed_command
+@requires_session_container
 async def computer_screenshot(context=None):
     """Get a screenshot from the computer use virtual desktop.
     Similar to examine_image, this will insert the screenshot into the chat.
@@ -76,11 +310,11 @@ async def computer_screenshot(context=None):
     """
     client = await get_computer_client(context)
     try:
-        screenshot = await client.get_screenshot()
+        screenshot = await _capture_screenshot(client, context)
         if screenshot:
-            # Insert the screenshot into the chat context
-            message = await context.format_image_message(screenshot)
-            return message
+            _remember_frame(client, screenshot, context)
+            # Returned as the command result, which inserts it into the chat context
+            return screenshot.to_image_part()
         else:
             return {"status": "error", "message": "Failed to get screenshot"}
     except Exception as e:
@@ -88,6 +322,67 @@ async def computer_screenshot(context=None):
         return {"status": "error", "message": str(e)}
 
 @command()
+@timed_command
+@requires_session_container
+async def computer_screenshot_region(x, y, width, height, zoom=1, context=None):
+    """Get a screenshot of just one area of the virtual desktop, optionally enlarged.
+    Cheaper than a full screenshot when only a dialog, form field or small
+    text needs a closer look. The region is cut from the full resolution
+    screen, so zooming in shows detail that downscaled screenshots lose.
+    
+    Parameters:
+    x - Integer. Left edge of the region, in the same coordinates as clicks.
+    y - Integer. Top edge of the region.
+    width - Integer. Width of the region.
+    height - Integer. Height of the region.
+    zoom - Number. Optional. Enlarge the region by this factor, up to 4 (default: 1).
+    
+    A point (px, py) in the returned image is at screen coordinates
+    (x + px * scale, y + py * scale), using the region and scale in the result.
+    
+    Example:
+    { "computer_screenshot_region": {"x": 400, "y": 300, "width": 320, "height": 200, "zoom": 2} }
+    """
+    if None in (x, y, width, height) or width <= 0 or height <= 0:
+        return {"status": "error", "message": "Missing or empty region"}
+    
+    client = await get_computer_client(context)
+    try:
+        # Capture at native resolution, and map the region from this agent's screenshot size
+        screenshot = await client.get_screenshot()
+        if not screenshot:
+            return {"status": "error", "message": "Failed to get screenshot"}
+        transform = ScreenTransform.for_screen(screenshot.width, screenshot.height, get_screenshot_settings(context))
+        left, top = transform.to_screen(x, y)
+        right, bottom = transform.to_screen(x + width, y + height)
+        left, top = max(0, left), max(0, top)
+        right, bottom = min(screenshot.width, right), min(screenshot.height, bottom)
+        if right <= left or bottom <= top:
+            return {"status": "error", "message": "Region is outside the screen"}
+        
+        region, info = crop_screenshot(screenshot, (left, top, right, bottom), zoom,
+                                       get_screenshot_settings(context))
+        await _add_image_to_chat(region, context)
+        
+        # Report the region as clipped to the screen, in the coordinates clicks use
+        region_x, region_y = transform.from_screen(left, top)
+        region_right, region_bottom = transform.from_screen(right, bottom)
+        return {
+            "status": "ok",
+            "region": {"x": region_x, "y": region_y,
+                       "width": region_right - region_x, "height": region_bottom - region_y},
+            "image_width": info["width"],
+            "image_height": info["height"],
+            "scale": round((region_right - region_x) / info["width"], 4),
+            "screenshot_bytes": info["bytes"]
+        }
+    except Exception as e:
+        logger.error(f"Screenshot region error: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@command()
+@timed_command
+@requires_session_container
 async def computer_click(x, y, context=None):
     """Click at specified coordinates in the computer use virtual desktop.
     
@@ -101,75 +396,75 @@ async def computer_click(x, y, context=None):
     if x is None or y is None:
         return {"status": "error", "message": "Missing x or y coordinates"}
     
-    client = await get_computer_client(context)
-    result = await client.click(x, y)
+    client = await _get_action_client(context)
+    result = await client.click(x, y, await _get_screen_transform(client, context))
     
     # Get a screenshot after clicking to show the result
-    try:
-        screenshot = await client.get_screenshot()
-        if screenshot:
-            await context.format_image_message(screenshot)
-    except Exception as e:
-        logger.error(f"Post-click screenshot error: {str(e)}")
-        pass  # Don't fail the command if screenshot fails
+    await _post_action_screenshot(client, result, "click", context)
     
     return result
 
 @command()
-async def computer_type(text, context=None):
+@timed_command
+@requires_session_container
+async def computer_type(text, method="auto", context=None):
     """Type text in the computer use virtual desktop.
+    Long text is pasted through the clipboard, which takes about the same
+    time however long the text is.
     
     Parameters:
     text - String. The text to type.
+    method - String. Optional. "auto" (default) pastes long text and types short text,
+             "paste" or "type" forces one. Use "type" where pasting doesn't work,
+             e.g. in terminals or fields that block paste.
     
     Example:
     { "computer_type": {"text": "Hello, world!"} }
+    { "computer_type": {"text": "echo hello", "method": "type"} }
     """
     if not text:
         return {"status": "error", "message": "Missing text parameter"}
     
-    client = await get_computer_client(context)
-    result = await client.type_text(text)
+    client = await _get_action_client(context)
+    result = await client.type_text(text, method)
     
     # Get a screenshot after typing to show the result
-    try:
-        screenshot = await client.get_screenshot()
-        if screenshot:
-            await context.format_image_message(screenshot)
-    except Exception as e:
-        logger.error(f"Post-type screenshot error: {str(e)}")
-        pass  # Don't fail the command if screenshot fails
+    await _post_action_screenshot(client, result, "type", context)
     
     return result
 
 @command()
+@timed_command
+@requires_session_container
 async def computer_press_key(key, context=None):
-    """Press a keyboard key in the computer use virtual desktop.
+    """Press a keyboard key, key combination or sequence of keys in the computer use virtual desktop.
+    A whole sequence runs in one command with a single screenshot at the end.
     
     Parameters:
-    key - String. The key to press (e.g., "enter", "tab", "escape").
+    key - String. The key to press (e.g., "enter", "tab", "escape"). Join keys with
+          "+" for a combination ("ctrl+shift+t"), add "*N" to press it N times ("tab*3"),
+          and separate keys with spaces or commas for a sequence ("tab tab enter").
+          Use "plus" and "comma" for those characters.
     
     Example:
     { "computer_press_key": {"key": "enter"} }
+    { "computer_press_key": {"key": "ctrl+l"} }
+    { "computer_press_key": {"key": "tab*3 enter"} }
     """
     if not key:
         return {"status": "error", "message": "Missing key parameter"}
     
-    client = await get_computer_client(context)
+    client = await _get_action_client(context)
     result = await client.press_key(key)
     
     # Get a screenshot after pressing key to show the result
-    try:
-        screenshot = await client.get_screenshot()
-        if screenshot:
-            await context.format_image_message(screenshot)
-    except Exception as e:
-        logger.error(f"Post-key screenshot error: {str(e)}")
-        pass  # Don't fail the command if screenshot fails
+    await _post_action_screenshot(client, result, "key", context)
     
     return result
 
 @command()
+@timed_command
+@requires_session_container
 async def computer_scroll(amount, axis='v', context=None):
     """Scroll the page vertically or horizontally.
     
@@ -181,21 +476,17 @@ async def computer_scroll(amount, axis='v', context=None):
     { "computer_scroll": {"amount": 300} }  # Scroll down 300 pixels
     { "computer_scroll": {"amount": -100, "axis": "h"} }  # Scroll left 100 pixels
     """
-    client = await get_computer_client(context)
+    client = await _get_action_client(context)
     result = await client.scroll(amount, axis)
     
     # Get a screenshot after scrolling to show the result
-    try:
-        screenshot = await client.get_screenshot()
-        if screenshot:
-            await context.format_image_message(screenshot)
-    except Exception as e:
-        logger.error(f"Post-scroll screenshot error: {str(e)}")
-        pass  # Don't fail the command if screenshot fails
+    await _post_action_screenshot(client, result, "scroll", context)
     
     return result
 
 @command()
+@timed_command
+@requires_session_container
 async def computer_mouse_move(x, y, context=None):
     """Move the mouse cursor to the specified coordinates without clicking.
     
@@ -206,11 +497,13 @@ async def computer_mouse_move(x, y, context=None):
     Example:
     { "computer_mouse_move": {"x": 100, "y": 200} }
     """
-    client = await get_computer_client(context)
-    result = await client.mouse_move(x, y)
+    client = await _get_action_client(context)
+    result = await client.mouse_move(x, y, await _get_screen_transform(client, context))
     return result
 
 @command()
+@timed_command
+@requires_session_container
 async def computer_right_click(context=None):
     """Perform a right mouse click at the current cursor position.
     Use computer_mouse_move first to position the cursor.
@@ -218,21 +511,17 @@ async def computer_right_click(context=None):
     Example:
     { "computer_right_click": {} }
     """
-    client = await get_computer_client(context)
+    client = await _get_action_client(context)
     result = await client.right_click()
     
     # Get a screenshot after clicking to show the result
-    try:
-        screenshot = await client.get_screenshot()
-        if screenshot:
-            await context.format_image_message(screenshot)
-    except Exception as e:
-        logger.error(f"Post-right-click screenshot error: {str(e)}")
-        pass  # Don't fail the command if screenshot fails
+    await _post_action_screenshot(client, result, "right-click", context)
     
     return result
 
 @command()
+@timed_command
+@requires_session_container
 async def computer_double_click(context=None):
     """Perform a double-click at the current cursor position.
     Use computer_mouse_move first to position the cursor.
@@ -240,21 +529,17 @@ async def computer_double_click(context=None):
     Example:
     { "computer_double_click": {} }
     """
-    client = await get_computer_client(context)
+    client = await _get_action_client(context)
     result = await client.double_click()
     
     # Get a screenshot after clicking to show the result
-    try:
-        screenshot = await client.get_screenshot()
-        if screenshot:
-            await context.format_image_message(screenshot)
-    except Exception as e:
-        logger.error(f"Post-double-click screenshot error: {str(e)}")
-        pass  # Don't fail the command if screenshot fails
+    await _post_action_screenshot(client, result, "double-click", context)
     
     return result
 
 @command()
+@timed_command
+@requires_session_container
 async def computer_drag(start_x, start_y, end_x, end_y, hold_ms=100, context=None):
     """Perform a drag operation from start to end coordinates.
     
@@ -268,40 +553,216 @@ async def computer_drag(start_x, start_y, end_x, end_y, hold_ms=100, context=Non
     Example:
     { "computer_drag": {"start_x": 100, "start_y": 200, "end_x": 300, "end_y": 400} }
     """
-    client = await get_computer_client(context)
-    result = await client.drag(start_x, start_y, end_x, end_y, hold_ms)
+    client = await _get_action_client(context)
+    result = await client.drag(start_x, start_y, end_x, end_y, hold_ms, await _get_screen_transform(client, context))
     
     # Get a screenshot after dragging to show the result
+    await _post_action_screenshot(client, result, "drag", context)
+    
+    return result
+
+@command()
+@timed_command
+@requires_session_container
+async def computer_batch(actions, context=None):
+    """Run a sequence of actions in one command and take a single screenshot at the end.
+    Steps run in order and the batch stops at the first failing step.
+    
+    Parameters:
+    actions - List. Each item has an "action" name plus that action's parameters:
+              click (x, y), type (text), key (key), scroll (amount, axis),
+              mouse_move (x, y), right_click, double_click,
+              drag (start_x, start_y, end_x, end_y, hold_ms), wait (ms).
+              Any step may add "delay_ms" to pause before the next step.
+    
+    Example:
+    { "computer_batch": {"actions": [
+        {"action": "click", "x": 400, "y": 300},
+        {"action": "type", "text": "jane@example.com"},
+        {"action": "key", "key": "tab", "delay_ms": 100},
+        {"action": "type", "text": "secret"},
+        {"action": "key", "key": "enter"}
+    ]} }
+    """
+    if not actions or not isinstance(actions, list):
+        return {"status": "error", "message": "Missing actions list"}
+    
+    client = await _get_action_client(context)
+    result = await client.batch(actions, await _get_screen_transform(client, context))
+    
+    # Get one screenshot after the whole batch to show the result
+    await _post_action_screenshot(client, result, "batch", context)
+    
+    return result
+
+@command()
+@timed_command
+@requires_session_container
+async def computer_wait_for_screen_change(timeout_ms=5000, threshold=0.001, region=None, context=None):
+    """Wait until the screen changes, then add the new screenshot to the chat.
+    Useful after clicking a link or submitting a form, instead of guessing
+    when to take a screenshot.
+    
+    Parameters:
+    timeout_ms - Integer. Optional. How long to wait in milliseconds (default: 5000).
+    threshold - Number. Optional. Fraction of pixels that must change (default: 0.001).
+    region - Object. Optional. Only watch this area: {"x", "y", "width", "height"}.
+    
+    Example:
+    { "computer_wait_for_screen_change": {"timeout_ms": 8000} }
+    { "computer_wait_for_screen_change": {"region": {"x": 0, "y": 0, "width": 800, "height": 60}} }
+    """
+    client = await get_computer_client(context)
+    settings = get_screenshot_settings(context)
     try:
-        screenshot = await client.get_screenshot()
+        screenshot, result = await client.wait_for_change(timeout=timeout_ms / 1000, threshold=threshold,
+                                                          region=region, settings=settings)
         if screenshot:
-            await context.format_image_message(screenshot)
+            _remember_frame(client, screenshot, context)
+            await _add_image_to_chat(screenshot, context)
+        return result
     except Exception as e:
-        logger.error(f"Post-drag screenshot error: {str(e)}")
-        pass  # Don't fail the command if screenshot fails
+        logger.error(f"Wait for screen change error: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@command()
+@timed_command
+@requires_session_container
+async def computer_wait_until_idle(stable_ms=500, timeout_ms=10000, region=None, context=None):
+    """Wait until the screen has stopped changing, then add the screenshot to the chat.
+    Useful while a page is loading or an animation is running.
     
-    return result
+    Parameters:
+    stable_ms - Integer. Optional. How long the screen must stay unchanged in milliseconds (default: 500).
+    timeout_ms - Integer. Optional. How long to wait in milliseconds (default: 10000).
+    region - Object. Optional. Only watch this area: {"x", "y", "width", "height"}.
+    
+    Example:
+    { "computer_wait_until_idle": {"stable_ms": 1000} }
+    """
+    client = await get_computer_client(context)
+    settings = get_screenshot_settings(context)
+    try:
+        screenshot, result = await client.wait_until_idle(stable_time=stable_ms / 1000, timeout=timeout_ms / 1000,
+                                                          region=region, settings=settings)
+        if screenshot:
+            _remember_frame(client, screenshot, context)
+            await _add_image_to_chat(screenshot, context)
+        return result
+    except Exception as e:
+        logger.error(f"Wait until idle error: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@command()
+@timed_command
+async def computer_screenshot_history(context=None):
+    """List the screenshots recently shown in this chat, without taking a new one.
+    Each action's screenshot is a numbered step; steps can be fetched again
+    with computer_get_past_screenshot or compared with computer_diff_screenshots.
+    
+    Example:
+    { "computer_screenshot_history": {} }
+    """
+    history = get_history(getattr(context, "log_id", None))
+    if history is None:
+        return {"status": "ok", "steps": []}
+    return {"status": "ok", "steps": history.describe()}
+
+@command()
+@timed_command
+async def computer_get_past_screenshot(step=-1, context=None):
+    """Add an earlier screenshot from this chat back into the chat, without touching the desktop.
+    
+    Parameters:
+    step - Integer. Optional. Step number from computer_screenshot_history, or a
+           negative number counting back from the latest screenshot (-1, the default,
+           is the latest and -2 the one before it).
+    
+    Example:
+    { "computer_get_past_screenshot": {"step": -3} }
+    """
+    history = get_history(getattr(context, "log_id", None))
+    entry = history.resolve(step) if history else None
+    if entry is None:
+        return {"status": "not_found", "message": f"No screenshot for step {step} in the history"}
+    screenshot = history.get(entry["step"])
+    await _add_image_to_chat(screenshot, context)
+    return {"status": "ok", "step": entry["step"], "screenshot_bytes": len(screenshot.data)}
+
+@command()
+@timed_command
+async def computer_diff_screenshots(from_step=-2, to_step=-1, context=None):
+    """Compare two screenshots from this chat's history, without taking a new one.
+    Reports how much of the screen changed and the box around the changes.
+    
+    Parameters:
+    from_step - Integer. Optional. Earlier step (default: -2, the screenshot before the latest).
+    to_step - Integer. Optional. Later step (default: -1, the latest screenshot).
+    
+    Example:
+    { "computer_diff_screenshots": {"from_step": -3, "to_step": -1} }
+    """
+    history = get_history(getattr(context, "log_id", None))
+    entries = [history.resolve(step) if history else None for step in (from_step, to_step)]
+    if None in entries:
+        return {"status": "not_found", "message": "Step not in the screenshot history"}
+    try:
+        diff = diff_frames(history.get(entries[0]["step"]), history.get(entries[1]["step"]))
+    except Exception as e:
+        logger.error(f"Screenshot diff error: {str(e)}")
+        return {"status": "error", "message": str(e)}
+    diff["difference"] = round(diff["difference"], 4)
+    return {"status": "ok", "from_step": entries[0]["step"], "to_step": entries[1]["step"], **diff}
 
 @command()
-async def computer_get_cursor_position(context=None):
+@timed_command
+@requires_session_container
+async def computer_get_cursor_position(force_refresh=False, context=None):
     """Get the current cursor position.
+    The position is known from the last mouse action, so this is usually
+    answered without asking the desktop.
+    
+    Parameters:
+    force_refresh - Boolean. Optional. Ask the desktop instead (default: false).
     
     Example:
     { "computer_get_cursor_position": {} }
     """
     client = await get_computer_client(context)
-    return await client.get_cursor_position()
+    result = await client.get_cursor_position(refresh=force_refresh)
+    # Report the position in the same space as the screenshots
+    if result and isinstance(result.get("x"), (int, float)) and isinstance(result.get("y"), (int, float)):
+        transform = await _get_screen_transform(client, context)
+        result["x"], result["y"] = transform.from_screen(result["x"], result["y"])
+    return result
 
 @command()
-async def computer_get_screen_size(context=None):
+@timed_command
+@requires_session_container
+async def computer_get_screen_size(force_refresh=False, context=None):
     """Get the current screen size of the virtual desktop.
+    If screenshots are downscaled, this is the size they are sent at, which
+    is the coordinate space used by all mouse commands. The size is kept up
+    to date from every screenshot, so this is usually answered without
+    asking the desktop.
+    
+    Parameters:
+    force_refresh - Boolean. Optional. Ask the desktop instead (default: false).
     
     Example:
     { "computer_get_screen_size": {} }
     """
     client = await get_computer_client(context)
-    return await client.get_screen_size()
+    result = await client.get_screen_size(refresh=force_refresh)
+    _apply_screenshot_scale(result, context)
+    return result
 
+@hook()
+async def quit(context=None):
+    """Close pooled API connections, the Docker event stream and pool containers when the server shuts down"""
+    await shutdown_computer_pool()
+    await close_computer_clients()
+    await stop_status_watcher()
 
 @pipe(name='filter_messages', priority=10)
 async def add_screen_size_to_message(data: dict, context=None) -> dict:
@@ -310,15 +771,17 @@ async def add_screen_size_to_message(data: dict, context=None) -> dict:
         # Only proceed if there are messages
         if 'messages' in data and isinstance(data['messages'], list) and len(data['messages']) > 0:
             # Get the first message (system message)
-            if data['messages'][0]['role'] == 'system':
+            if data['messages'][0]['role'] == 'system' and not session_released(getattr(context, "log_id", None)):
                 # Get the computer client
                 client = await get_computer_client(context)
                 
-                # Get the screen size
+                # Get the screen size (cached, so this is cheap on every message)
                 screen_size = await client.get_screen_size()
                 
                 # If successful, add to system message
                 if screen_size and screen_size.get("status") == "ok":
+                    # Advertise the size screenshots are sent at
+                    _apply_screenshot_scale(screen_size, context)
                     width = screen_size.get("width", "unknown")
                     height = screen_size.get("height", "unknown")
                     
@@ -336,3 +799,108 @@ async def add_screen_size_to_message(data: dict, context=None) -> dict:
         pass
         
     return data
+
+# Seconds a pending capture may take beyond its delay and settle timeout before the model goes ahead without it
+PENDING_CAPTURE_GRACE = 5
+
+# Text that replaces screenshots too old to send to the model
+OLD_SCREENSHOT_PLACEHOLDER = "[Older screenshot removed to save context]"
+
+def _image_part_data(part):
+    """Get the base64 data of an image content part, or None if the part isn't an inline image"""
+    if not isinstance(part, dict):
+        return None
+    if part.get("type") == "image_url":
+        url = part.get("image_url")
+        url = url.get("url") if isinstance(url, dict) else url
+        if isinstance(url, str) and url.startswith("data:") and "," in url:
+            return url.split(",", 1)[1]
+    elif part.get("type") == "image":
+        source = part.get("source")
+        if isinstance(source, dict) and source.get("type") == "base64":
+            return source.get("data")
+    return None
+
+def _shrink_image_part(part, data, config):
+    """Replace an image content part with a thumbnail or a text placeholder"""
+    if config["old_screenshots"] == "thumbnail":
+        try:
+            media_type, thumbnail = thumbnail_base64(data, config["thumbnail_size"], config["thumbnail_quality"])
+            if part["type"] == "image_url":
+                image_url = part["image_url"] if isinstance(part["image_url"], dict) else {}
+                return {**part, "image_url": {**image_url, "url": f"data:{media_type};base64,{thumbnail}"}}
+            return {**part, "source": {**part["source"], "media_type": media_type, "data": thumbnail}}
+        except Exception as e:
+            logger.warning(f"Could not make a thumbnail of an old screenshot: {str(e)}")
+    return {"type": "text", "text": OLD_SCREENSHOT_PLACEHOLDER}
+
+async def _add_pending_screenshot(data, context=None):
+    """Wait for a background post-action capture so this turn sees its screenshot.
+    The capture adds the screenshot to the chat itself. It is only added to
+    this turn's messages as well if they were taken from the chat before it.
+    """
+    session_id = getattr(context, "log_id", None)
+    task = _pending_captures.get(session_id)
+    if task is None:
+        return
+    if not task.done():
+        settings = get_screenshot_settings(context)
+        timeout = (settings["capture_delay_ms"] + settings["settle_timeout_ms"]) / 1000 + PENDING_CAPTURE_GRACE
+        await asyncio.wait({task}, timeout=timeout)
+        if not task.done():
+            # Go ahead without it; the chat has it for the next turn if it finishes
+            return
+    if _pending_captures.get(session_id) is task:
+        del _pending_captures[session_id]
+    if task.cancelled():
+        return
+    image_message = task.result()
+    if image_message is not None and image_message not in data['messages']:
+        data['messages'] = list(data['messages']) + [image_message]
+
+@pipe(name='filter_messages', priority=10)
+async def prune_old_screenshots(data: dict, context=None) -> dict:
+    """Send only the most recent screenshots at full size.
+    Older images are swapped for thumbnails or a placeholder, so the size
+    of each request stays about the same however long the session runs.
+    The stored chat history is left as it is. A screenshot still being
+    captured in the background after an action is added first.
+    """
+    if not isinstance(data.get('messages'), list):
+        return data
+    try:
+        # A background post-action capture belongs to this turn, so it counts as the newest screenshot
+        await _add_pending_screenshot(data, context)
+    except Exception as e:
+        logger.error(f"Error adding pending screenshot: {str(e)}")
+    try:
+        config = {**DEFAULT_CONTEXT_CONFIG, **_get_config().get("context", {})}
+        if config["old_screenshots"] == "keep":
+            return data
+        
+        # Copy the list so the messages stored for the chat are not modified
+        messages = list(data['messages'])
+        seen = 0
+        for index in range(len(messages) - 1, -1, -1):
+            message = messages[index]
+            content = message.get('content') if isinstance(message, dict) else None
+            if not isinstance(content, list):
+                continue
+            new_content = None
+            for part_index in range(len(content) - 1, -1, -1):
+                image_data = _image_part_data(content[part_index])
+                if image_data is None:
+                    continue
+                seen += 1
+                if seen <= config["keep_screenshots"]:
+                    continue
+                if new_content is None:
+                    new_content = list(content)
+                new_content[part_index] = _shrink_image_part(content[part_index], image_data, config)
+            if new_content is not None:
+                messages[index] = {**message, 'content': new_content}
+        data['messages'] = messages
+    except Exception as e:
+        logger.error(f"Error pruning old screenshots: {str(e)}")
+    
+    return data
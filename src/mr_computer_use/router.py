@@ -1,12 +1,21 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, Response
 from lib.templates import render
-from .docker_control import check_docker, start_computer_container, stop_computer_container
-import docker
+from .docker_control import start_computer_container, stop_computer_container, _get_config
+from .container_status import ensure_status_watcher, get_cached_status, subscribe, unsubscribe
+from .computer_client import close_computer_client, invalidate_screen_sizes
+from .metrics import render_prometheus
+from .screenshot_history import get_history
+from .image_processing import diff_frames
+import asyncio
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Seconds between keepalive comments on an idle status stream
+STATUS_STREAM_HEARTBEAT = 15
+
 router = APIRouter()
 
 @router.get("/computer_use")
@@ -19,26 +28,30 @@ async def computer_use_page(request: Request):
 @router.get("/computer_use/api/status")
 async def computer_use_status(request: Request):
     """Get computer use container status"""
-    docker_check = await check_docker()
-    if docker_check["status"] != "ok":
-        return JSONResponse({"status": "docker_error", "message": docker_check["message"]})
+    await ensure_status_watcher()
+    return JSONResponse(get_cached_status())
+
+@router.get("/computer_use/api/status/stream")
+async def computer_use_status_stream(request: Request):
+    """Stream container status changes as server-sent events"""
+    await ensure_status_watcher()
+    queue = subscribe()
+    
+    async def events():
+        try:
+            yield f"data: {json.dumps(get_cached_status())}\n\n"
+            while True:
+                try:
+                    status = await asyncio.wait_for(queue.get(), STATUS_STREAM_HEARTBEAT)
+                    yield f"data: {json.dumps(status)}\n\n"
+                except asyncio.TimeoutError:
+                    # Keep the connection open through proxies
+                    yield ": keepalive\n\n"
+        finally:
+            unsubscribe(queue)
     
-    # Check if container is running
-    try:
-        client = docker.from_env()
-        containers = client.containers.list(filters={"name": "mindroot_computer_use"})
-        if containers:
-            return JSONResponse({"status": "running"})
-        
-        # Check if container exists but is stopped
-        containers = client.containers.list(all=True, filters={"name": "mindroot_computer_use"})
-        if containers:
-            return JSONResponse({"status": "stopped"})
-        
-        return JSONResponse({"status": "not_created"})
-    except Exception as e:
-        logger.error(f"Status check error: {str(e)}")
-        return JSONResponse({"status": "error", "message": str(e)})
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.post("/computer_use/api/start")
 async def computer_use_start(request: Request):
@@ -46,10 +59,52 @@ async def computer_use_start(request: Request):
     print("###################################################################")
     print("Starting computer use container")
     result = await start_computer_container()
+    invalidate_screen_sizes()
     return JSONResponse(result)
 
 @router.post("/computer_use/api/stop")
 async def computer_use_stop(request: Request):
     """Stop computer use container"""
     result = await stop_computer_container()
+    await close_computer_client(_get_config()['api_url'])
     return JSONResponse(result)
+
+@router.get("/computer_use/api/metrics")
+async def computer_use_metrics(request: Request):
+    """Command, API request and screenshot metrics in Prometheus text format"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+def _get_own_history(session_id, request):
+    """Get a chat session's screenshot history, if it belongs to the user making the request.
+    Other users' sessions are treated as having no history.
+    """
+    user = request.state.user.username if hasattr(request.state, 'user') else None
+    history = get_history(session_id)
+    if history is None or user is None or history.owner != user:
+        return None
+    return history
+
+@router.get("/computer_use/api/history/{session_id}")
+async def computer_use_history(session_id: str, request: Request):
+    """List the screenshot history of a chat session"""
+    history = _get_own_history(session_id, request)
+    return JSONResponse({"status": "ok", "steps": history.describe() if history else []})
+
+@router.get("/computer_use/api/history/{session_id}/diff")
+async def computer_use_history_diff(session_id: str, request: Request, from_step: int = -2, to_step: int = -1):
+    """Compare two steps of a session's screenshot history"""
+    history = _get_own_history(session_id, request)
+    entries = [history.resolve(step) if history else None for step in (from_step, to_step)]
+    if None in entries:
+        return JSONResponse({"status": "not_found"}, status_code=404)
+    diff = diff_frames(history.get(entries[0]["step"]), history.get(entries[1]["step"]))
+    return JSONResponse({"status": "ok", "from_step": entries[0]["step"], "to_step": entries[1]["step"], **diff})
+
+@router.get("/computer_use/api/history/{session_id}/{step}")
+async def computer_use_history_frame(session_id: str, step: int, request: Request):
+    """Get the image shown at one step of a session's screenshot history"""
+    history = _get_own_history(session_id, request)
+    screenshot = history.get(step) if history else None
+    if screenshot is None:
+        return JSONResponse({"status": "not_found"}, status_code=404)
+    return Response(screenshot.data, media_type=screenshot.media_type)
@@ -0,0 +1,114 @@
+from collections import OrderedDict, deque
+import time
+from .docker_control import _get_config, DEFAULT_HISTORY_CONFIG
+
+# History of each chat session, least recently used first
+_histories = OrderedDict()
+
+def _get_history_config():
+    """Get the history settings merged over the defaults"""
+    return {**DEFAULT_HISTORY_CONFIG, **_get_config().get("history", {})}
+
+class ScreenshotHistory:
+    """Ring buffer of the frames delivered to one session, bounded by count and size.
+
+    Every delivered frame gets the next step number. Frames are kept as their
+    encoded bytes and stored once per distinct hash, so steps that showed the
+    same screen share one copy. The oldest steps are dropped first.
+    """
+    def __init__(self, max_frames, max_bytes, owner=None):
+        self.max_frames = max_frames
+        self.owner = owner
+        self.max_bytes = max_bytes
+        self.steps = deque()
+        self.frames = {}
+        self.references = {}
+        self.total_bytes = 0
+        self.next_step = 0
+
+    def add(self, screenshot):
+        """Record a frame as the next step and return its step number"""
+        digest = screenshot.digest
+        if digest not in self.frames:
+            self.frames[digest] = screenshot.detached()
+            self.references[digest] = 0
+            self.total_bytes += len(screenshot.data)
+        self.references[digest] += 1
+        step = self.next_step
+        self.next_step += 1
+        self.steps.append({"step": step, "digest": digest, "time": time.time()})
+        # Always keep the newest step, even if it alone is over the size limit
+        while len(self.steps) > 1 and (len(self.steps) > self.max_frames or self.total_bytes > self.max_bytes):
+            self._drop_oldest()
+        return step
+
+    def _drop_oldest(self):
+        entry = self.steps.popleft()
+        digest = entry["digest"]
+        self.references[digest] -= 1
+        if not self.references[digest]:
+            del self.references[digest]
+            self.total_bytes -= len(self.frames.pop(digest).data)
+
+    def resolve(self, step):
+        """Find a step's entry. Negative numbers count back from the latest step (-1)."""
+        if not self.steps:
+            return None
+        step = int(step)
+        if step < 0:
+            step = self.next_step + step
+        index = step - self.steps[0]["step"]
+        if index < 0 or index >= len(self.steps):
+            return None
+        return self.steps[index]
+
+    def get(self, step):
+        """Get the frame shown at a step, or None if it is not in the history"""
+        entry = self.resolve(step)
+        return self.frames[entry["digest"]] if entry else None
+
+    def describe(self):
+        """Get the steps in the history with the size of their frames, oldest first"""
+        described = []
+        for entry in self.steps:
+            frame = self.frames[entry["digest"]]
+            described.append({
+                "step": entry["step"],
+                "time": round(entry["time"], 3),
+                "width": frame.width,
+                "height": frame.height,
+                "format": frame.format.lower(),
+                "bytes": len(frame.data),
+                "hash": entry["digest"]
+            })
+        return described
+
+def get_history(session_id):
+    """Get a session's screenshot history, or None if it has none"""
+    history = _histories.get(session_id)
+    if history is not None:
+        _histories.move_to_end(session_id)
+    return history
+
+def record_frame(session_id, screenshot, owner=None):
+    """Add a frame delivered to a session to its history.
+    Returns the step number, or None if the history is disabled.
+    
+    Args:
+        session_id: The chat session
+        screenshot: The Screenshot delivered
+        owner: Name of the user the session belongs to, who alone may view the history over HTTP
+    """
+    config = _get_history_config()
+    if not config["enabled"]:
+        return None
+    history = get_history(session_id)
+    if history is None:
+        history = _histories[session_id] = ScreenshotHistory(config["max_frames"], config["max_bytes"], owner)
+        while len(_histories) > config["max_sessions"]:
+            _histories.popitem(last=False)
+    return history.add(screenshot)
+
+def clear_history(session_id):
+    """Forget a session's screenshot history, e.g. when its desktop is reset or released"""
+    _histories.pop(session_id, None)
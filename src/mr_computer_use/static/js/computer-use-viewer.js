@@ -3,7 +3,6 @@ import { html, css } from '/chat/static/js/lit-core.min.js';
 
 class ComputerUseViewer extends BaseEl {
   static properties = {
-    refreshRate: { type: Number },
     containerStatus: { type: String },
     isFullscreen: { type: Boolean }
   };
@@ -78,34 +77,36 @@ class ComputerUseViewer extends BaseEl {
 
   constructor() {
     super();
-    this.refreshRate = 2000; // ms
     this.containerStatus = 'unknown';
     this.isFullscreen = false;
-    this.interval = null;
+    this.statusStream = null;
   }
   
   connectedCallback() {
     super.connectedCallback();
-    this.checkContainerStatus();
-    this.interval = setInterval(() => this.checkContainerStatus(), this.refreshRate);
+    this.subscribeToStatus();
   }
   
   disconnectedCallback() {
     super.disconnectedCallback();
-    if (this.interval) {
-      clearInterval(this.interval);
+    if (this.statusStream) {
+      this.statusStream.close();
+      this.statusStream = null;
     }
   }
   
-  async checkContainerStatus() {
-    try {
-      const response = await fetch('/computer_use/api/status');
-      const data = await response.json();
+  subscribeToStatus() {
+    // The server pushes status changes, so there is no need to poll
+    this.statusStream = new EventSource('/computer_use/api/status/stream');
+    this.statusStream.onmessage = (event) => {
+      const data = JSON.parse(event.data);
       this.containerStatus = data.status;
-    } catch (error) {
+    };
+    this.statusStream.onerror = (error) => {
+      // EventSource reconnects on its own; show the error until it does
       this.containerStatus = 'error';
-      console.error('Failed to check container status:', error);
-    }
+      console.error('Container status stream error:', error);
+    };
   }
   
   async startContainer() {